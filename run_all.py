@@ -1,7 +1,34 @@
+import argparse
+import importlib
 import subprocess
 import time
 import glob
 import os
+import traceback
+
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+
+from src.data.scripts.pipeline_context import (
+    PipelineContext,
+    BUILDING_BENCHMARKS,
+    HISTORIC_DATA,
+    NEWEST_DATA,
+)
+from src.data.scripts.pipeline_manifest import (
+    cache_step_outputs,
+    can_skip_step,
+    get_step_keys,
+    load_manifest,
+    restore_step_outputs,
+    save_manifest,
+)
+from src.data.scripts.clean_and_split_data import source_chunk_size_env_var
+from src.data.scripts.utils import get_data_file_path
 
 # Color codes for output
 RED = "\033[0;31m"
@@ -18,6 +45,13 @@ def print_step_header(step_number, total_steps, description):
     print(f"{LIGHT_BLUE}=================================================={NC}")
 
 
+def print_skipped_step(step_number, total_steps, description):
+    print(
+        f"{LIGHT_BLUE}\nSkipping Step {step_number} / {total_steps} - {description}{NC}"
+        " (code and inputs unchanged, reusing its cached outputs)"
+    )
+
+
 def handle_error(message):
     print(f"{RED}\nError: {message}{NC}")
     exit(1)
@@ -34,6 +68,7 @@ def clean_dist_directory():
 
 
 def run_python_script(module):
+    """Run a pipeline step in a fresh `uv run python -m` subprocess"""
     try:
         subprocess.run(["uv", "run", "python", "-m", module], check=True)
         return True
@@ -45,62 +80,335 @@ def run_python_script(module):
         return False
 
 
+def run_python_module(module, context):
+    """Run a pipeline step in this interpreter by importing its module and calling main(), so we
+    only pay for interpreter startup and importing pandas, scipy, etc. once per pipeline run. Steps
+    share the pipeline context, so they pass data to each other in memory rather than via CSVs"""
+    try:
+        importlib.import_module(module).main(context)
+        return True
+    except SystemExit as e:
+        # Treat an explicit `exit(0)` as success, like the subprocess runner would
+        if not e.code:
+            return True
+
+        print(f"{RED}Error running {module}: exited with {e.code}{NC}")
+        return False
+    except Exception:
+        traceback.print_exc()
+        print(f"{RED}Error running {module}, see traceback above{NC}")
+        return False
+
+
+def run_step_in_worker(module, input_frames):
+    """Run a pipeline step in a process pool worker, given copies of the frames it reads. Returns
+    whether the step succeeded and the frames it set, for the main process to pass on"""
+    context = PipelineContext()
+    context.frames.update(input_frames)
+
+    succeeded = run_python_module(module, context)
+
+    return succeeded, {name: context.frames[name] for name in context.changed}
+
+
+def run_script_in_worker(module):
+    """Run a pipeline step as a subprocess from a thread pool worker. The step passes its data on
+    via CSVs, so there are no frames to return"""
+    return run_python_script(module), {}
+
+
+def skip_step(index, pipeline_steps, context, args):
+    """Skip a step that ran last time with the same code and inputs, restoring its cached outputs"""
+    step = pipeline_steps[index]
+    print_skipped_step(index + 1, len(pipeline_steps), step["description"])
+
+    restore_step_outputs(step, None if args.subprocess else context)
+
+
+def record_step(step, step_key, manifest, context, args):
+    """
+    Cache the outputs of a step that just ran and note its key, so the next run can skip it. Also
+    done with --force, so the cache always holds the latest outputs
+    """
+    cache_step_outputs(step, None if args.subprocess else context)
+
+    manifest[step["module"]] = step_key
+    save_manifest(manifest)
+
+
+def get_step_dependencies(pipeline_steps):
+    """
+    Get the indexes of the earlier steps each step has to wait for, from the data they declare they
+    read and write. A step waits on any earlier step that writes data it reads or writes, and on any
+    earlier step reading data it writes, so it doesn't replace data another step is still reading
+    """
+    dependencies = []
+
+    for index, step in enumerate(pipeline_steps):
+        inputs, outputs = set(step["inputs"]), set(step["outputs"])
+
+        dependencies.append(
+            {
+                earlier_index
+                for earlier_index, earlier_step in enumerate(pipeline_steps[:index])
+                if set(earlier_step["outputs"]) & (inputs | outputs)
+                or set(earlier_step["inputs"]) & outputs
+            }
+        )
+
+    return dependencies
+
+
+def run_steps_in_parallel(pipeline_steps, step_keys, manifest, context, args):
+    """
+    Run the pipeline steps on a pool of workers, starting each step as soon as the steps it depends
+    on are done, so independent steps run at the same time. In-process steps run on a process pool
+    and are sent the frames they read, with the frames they set passed back into the context
+    """
+    dependencies = get_step_dependencies(pipeline_steps)
+
+    if args.subprocess:
+        # Each step already runs in its own subprocess, so threads are enough to wait on them
+        pool = ThreadPoolExecutor(max_workers=args.jobs)
+    else:
+        # Import every step up front, so forked workers don't each have to import them
+        for step in pipeline_steps:
+            importlib.import_module(step["module"])
+
+        pool = ProcessPoolExecutor(max_workers=args.jobs)
+
+    with pool:
+        waiting = list(range(len(pipeline_steps)))
+        running = {}
+        done = set()
+
+        while waiting or running:
+            for index in [i for i in waiting if dependencies[i] <= done]:
+                step = pipeline_steps[index]
+                waiting.remove(index)
+
+                if can_skip_step(step, step_keys[index], manifest):
+                    skip_step(index, pipeline_steps, context, args)
+                    done.add(index)
+                    continue
+
+                print_step_header(index + 1, len(pipeline_steps), step["description"])
+
+                if args.subprocess:
+                    future = pool.submit(run_script_in_worker, step["module"])
+                else:
+                    input_frames = {name: context.get(name) for name in step["inputs"]}
+                    future = pool.submit(
+                        run_step_in_worker, step["module"], input_frames
+                    )
+
+                running[future] = index
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+
+            for future in finished:
+                index = running.pop(future)
+
+                try:
+                    succeeded, output_frames = future.result()
+                except Exception:
+                    # The step couldn't be run or its results sent back (e.g. a frame that can't be
+                    # pickled), rather than the step itself failing
+                    traceback.print_exc()
+                    succeeded, output_frames = False, {}
+
+                if not succeeded:
+                    pool.shutdown(cancel_futures=True)
+                    handle_error(
+                        f"Step {index + 1} / {len(pipeline_steps)} failed! See logs above for info."
+                    )
+
+                for name, data in output_frames.items():
+                    context.set(name, data)
+
+                record_step(
+                    pipeline_steps[index], step_keys[index], manifest, context, args
+                )
+                done.add(index)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the full data pipeline")
+    parser.add_argument(
+        "--subprocess",
+        action="store_true",
+        help="Run each step in its own `uv run python -m` subprocess instead of in-process",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="How many steps to run at once (default: 1, running steps one after another in this "
+        "process). Pass e.g. the number of CPUs to run independent steps at the same time, with "
+        "their output interleaved",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Run every step, even those whose code and inputs haven't changed since the last run",
+    )
+    parser.add_argument(
+        "--source-chunk-size",
+        type=int,
+        help="Stream the city's CSV this many rows at a time rather than reading it all at once, "
+        "for source files too big to fit in memory",
+    )
+    return parser.parse_args()
+
+
 def main():
+    args = parse_args()
     start_time = time.time_ns()
 
+    # Passed to clean_and_split_data through the environment, so it also reaches subprocess steps
+    if args.source_chunk_size is not None:
+        os.environ[source_chunk_size_env_var] = str(args.source_chunk_size)
+
     print(f"{GREEN}Initializing data pipeline!{NC}")
     print(
         "Will be running from raw file at 'source/data/ChicagoEnergyBenchmarking.csv'."
     )
 
+    # Data the steps pass to each other in memory when run in-process, written out at the end
+    context = PipelineContext()
+
     # Step 0, clean the /dist directory
     clean_dist_directory()
 
-    # Each step of our data pipeline, in order
+    # Each step of our data pipeline, in order, with the shared data it reads (inputs) and replaces
+    # (outputs), which we use to work out which steps can run at the same time, plus any other files
+    # it reads (input_files) or writes (output_files), which we use to skip unchanged steps
     pipeline_steps = [
         {
             "module": "src.data.scripts.clean_and_split_data",
             "description": "clean_and_split_data",
+            "inputs": [],
+            "outputs": [NEWEST_DATA, HISTORIC_DATA],
+            "input_files": [
+                get_data_file_path("source", "ChicagoEnergyBenchmarking.csv"),
+                get_data_file_path(
+                    "source", "benchmark_building_locations_fixed.geojson"
+                ),
+            ],
+            "output_files": [],
+        },
+        {
+            "module": "src.data.scripts.process_data",
+            "description": "process_data",
+            "inputs": [NEWEST_DATA, HISTORIC_DATA],
+            "outputs": [BUILDING_BENCHMARKS, HISTORIC_DATA],
+            "input_files": [
+                get_data_file_path("source", "CityGeocoder.xlsx"),
+                "static/chicago-wards-2025.geojson",
+            ],
+            "output_files": [
+                get_data_file_path("dist", "building-benchmark-stats.json"),
+            ],
         },
-        {"module": "src.data.scripts.process_data", "description": "process_data"},
         {
             "module": "src.data.scripts.add_building_owners",
             "description": "add_building_owners",
+            "inputs": [BUILDING_BENCHMARKS],
+            "outputs": [BUILDING_BENCHMARKS],
+            "input_files": ["src/constants/building-owners-mapping.json"],
+            "output_files": [],
         },
         {
             "module": "src.data.scripts.generate_property_type_stats",
             "description": "generate_property_type_stats",
+            "inputs": [BUILDING_BENCHMARKS],
+            "outputs": [BUILDING_BENCHMARKS],
+            "input_files": [],
+            "output_files": [
+                get_data_file_path("dist", "property-types.json"),
+                get_data_file_path("dist", "building-statistics-by-property-type.json"),
+            ],
         },
         {
             "module": "src.data.scripts.detect_anomalous_buildings",
             "description": "detect_anomalous_buildings",
+            "inputs": [BUILDING_BENCHMARKS, HISTORIC_DATA],
+            "outputs": [BUILDING_BENCHMARKS],
+            "input_files": [],
+            "output_files": [],
         },
         {
             "module": "src.data.scripts.generate_historic_stats",
             "description": "generate_historic_stats",
+            "inputs": [HISTORIC_DATA],
+            "outputs": [],
+            "input_files": [],
+            "output_files": [get_data_file_path("dist", "historic-stats.json")],
         },
         {
             "module": "src.data.scripts.generate_historic_stats_by_property_type",
             "description": "generate_historic_stats_by_property_type",
+            "inputs": [HISTORIC_DATA, BUILDING_BENCHMARKS],
+            "outputs": [],
+            "input_files": [],
+            "output_files": [
+                get_data_file_path("dist", "historic-stats-by-property-type.json"),
+            ],
         },
         {
             "module": "src.data.scripts.calculate_fines",
             "description": "calculate_fines",
+            "inputs": [HISTORIC_DATA],
+            "outputs": [],
+            "input_files": [],
+            "output_files": [get_data_file_path("dist", "fines-by-year.json")],
         },
         {
             "module": "src.data.scripts.generate_search_index",
             "description": "generate_search_index",
+            "inputs": [BUILDING_BENCHMARKS],
+            "outputs": [],
+            "input_files": [],
+            "output_files": [get_data_file_path("dist", "building-search-index.csv")],
         },
     ]
 
-    for index, step in enumerate(pipeline_steps):
-        step_num = index + 1
-        print_step_header(step_num, len(pipeline_steps), step["description"])
+    # The key each step last ran with, so we can skip those with the same code and inputs this time
+    step_keys = get_step_keys(pipeline_steps)
+    manifest = {} if args.force else load_manifest()
+
+    if args.jobs > 1:
+        run_steps_in_parallel(pipeline_steps, step_keys, manifest, context, args)
+    else:
+        for index, step in enumerate(pipeline_steps):
+            step_num = index + 1
+
+            if can_skip_step(step, step_keys[index], manifest):
+                skip_step(index, pipeline_steps, context, args)
+                continue
+
+            print_step_header(step_num, len(pipeline_steps), step["description"])
+
+            if args.subprocess:
+                succeeded = run_python_script(step["module"])
+            else:
+                succeeded = run_python_module(step["module"], context)
+
+            if not succeeded:
+                handle_error(
+                    f"Step {step_num} / {len(pipeline_steps)} failed! See logs above for info."
+                )
+
+            record_step(step, step_keys[index], manifest, context, args)
+
+    # Write out the data the steps passed along in memory (a no-op in subprocess mode)
+    outputted_paths = context.write_outputs()
+
+    if outputted_paths:
+        print(f"\n{LIGHT_BLUE}Writing data held in memory to:{NC}")
 
-        if not run_python_script(step["module"]):
-            handle_error(
-                f"Step {step_num} / {len(pipeline_steps)} failed! See logs above for info."
-            )
+        for path in outputted_paths:
+            print(f" - {path}")
 
     end_time = time.time_ns()
     elapsed_nanoseconds = end_time - start_time
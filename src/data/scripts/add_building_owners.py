@@ -7,20 +7,20 @@ client-side filtering.
 """
 
 import json
+import pandas as pd
 from typing import Dict
-from src.data.scripts.utils import (
-    get_and_clean_csv,
-    get_data_file_path,
-    log_step_completion,
-    output_to_csv,
+from src.data.scripts.utils import log_step_completion
+from src.data.scripts.pipeline_context import (
+    PipelineContext,
+    BUILDING_BENCHMARKS,
+    load_pipeline_frame,
+    save_pipeline_frame,
 )
 
 # Debug flag for development
 debug = False
 
-# Input/output paths
-data_out_directory = "dist"
-building_emissions_file = "building-benchmarks.csv"
+# Input paths
 owners_json_path = "src/constants/building-owners-mapping.json"
 
 
@@ -50,20 +50,15 @@ def parse_owner_mappings(json_file: str) -> Dict[str, str]:
     return owner_map
 
 
-def add_owners_to_buildings() -> str:
+def add_owners_to_buildings(building_data: pd.DataFrame) -> pd.DataFrame:
     """
-    Add Owner column to building data CSV based on owner mappings.
+    Add Owner column to building data based on owner mappings.
 
-    Returns the output file path.
+    Returns the building data with the new column.
     """
     # Load owner mappings from JSON file
     owner_map = parse_owner_mappings(owners_json_path)
 
-    # Read the final building data CSV (after process_data.py)
-    building_data = get_and_clean_csv(
-        get_data_file_path(data_out_directory, building_emissions_file)
-    )
-
     # Add Owner column - map building ID to owner key
     building_data["Owner"] = (
         building_data["ID"].astype(str).map(lambda x: owner_map.get(x))
@@ -75,15 +70,27 @@ def add_owners_to_buildings() -> str:
             f"Added owner info to {matched_count} of {len(building_data)} building records"
         )
 
-    # Write back to the final CSV
-    output_path = get_data_file_path(data_out_directory, building_emissions_file)
-    output_to_csv(building_data, output_path)
+    return building_data
+
 
-    return output_path
+def main(context: PipelineContext | None = None) -> None:
+    # If run as part of the full pipeline, update the building data in memory
+    if context is not None:
+        context.set(
+            BUILDING_BENCHMARKS,
+            add_owners_to_buildings(context.get(BUILDING_BENCHMARKS)),
+        )
+        log_step_completion(3, [])
+        return
+
+    # Read the final building data (after process_data.py)
+    building_data = load_pipeline_frame(BUILDING_BENCHMARKS)
 
+    building_data = add_owners_to_buildings(building_data)
+
+    # Write back to the final CSV
+    output_path = save_pipeline_frame(BUILDING_BENCHMARKS, building_data)
 
-def main() -> None:
-    output_path = add_owners_to_buildings()
     log_step_completion(3, [output_path])
 
 
@@ -1,41 +1,187 @@
 """
-add_ward_numbers takes in a DataFrame of buildings and adds ward numbers
+add_ward_numbers takes in a DataFrame of buildings and adds ward numbers, looked up by address in the
+city geocoder, or for addresses it doesn't have, by which ward boundary the building's location is in
 
 Columns added:
 'Ward': int
 """
 
-import pandas as pd
+import functools
 import logging
-from src.data.scripts.utils import get_data_file_path
+import os
+import numpy as np
+import pandas as pd
+import shapely
+from shapely.geometry import shape
+from typing import cast
+from src.data.scripts.utils import (
+    fetch_geojson_coordinates,
+    get_data_file_path,
+    hash_file,
+)
 
-# Pull City Geocoder data into a Data Frame
 city_geocoder_path = get_data_file_path("source", "CityGeocoder.xlsx")
-city_geocoder = pd.read_excel(city_geocoder_path)
 
+# Parsing the geocoder's xlsx is slow, so we cache the ward index we build from it in a pickle, along
+# with the modified time and hash of the xlsx it came from
+city_geocoder_cache_path = get_data_file_path("debug", "city-geocoder-wards.pkl")
 
-def find_ward_number_by_city_geocoder(address: str) -> int | None:
-    """Finds ward number for a given address provided by the city geocoder"""
-    matches = city_geocoder[city_geocoder["Address"] == address]
+# Chicago's ward boundaries as GeoJSON in WGS84, the same file the site's ward maps use, used to find
+# the ward of buildings whose address isn't in the geocoder. If it's not there we only use the geocoder
+ward_boundaries_path = "static/chicago-wards-2025.geojson"
+
+# The property each ward boundary has its ward in, as e.g. "Ward 6", and the text before the number
+ward_boundary_property = "district"
+ward_boundary_prefix = "Ward "
+
+# The geocoder column with each address' ward, and the value it has for addresses without one
+ward_col = "Wards (Current - 2023)"
+no_ward_value = "---"
+
+
+def build_ward_index(geocoder: pd.DataFrame) -> pd.Series:
+    """
+    Builds an index of ward numbers by address from the city geocoder, so each building is a single
+    lookup instead of a scan of the whole geocoder. Uses the first row for each address, and leaves
+    out addresses the geocoder has no ward for ("---")
+    """
+    first_matches = geocoder.drop_duplicates(subset="Address").dropna(
+        subset=["Address", ward_col]
+    )
+    first_matches = first_matches.loc[first_matches[ward_col] != no_ward_value]
+
+    return first_matches.set_index("Address").loc[:, ward_col].astype(int)
+
+
+def load_cached_ward_index() -> dict | None:
+    """Load the cached ward index and the geocoder version it's from, if we have a readable one"""
+    if not os.path.exists(city_geocoder_cache_path):
+        return None
 
-    if matches.empty:
+    try:
+        return cast(dict, pd.read_pickle(city_geocoder_cache_path))
+    except Exception:
+        # A cache written by a different pandas version may not load, so we just rebuild it
         return None
-    row = matches.iloc[0]
 
-    ward_number = row["Wards (Current - 2023)"]
 
-    if ward_number == "---":
+def save_cached_ward_index(cache: dict) -> None:
+    """Save the ward index cache, skipping it if we can't write it since it's only a speedup"""
+    try:
+        pd.to_pickle(cache, city_geocoder_cache_path)
+    except OSError as e:
+        logging.warning(f"Couldn't cache city geocoder wards: {e}")
+
+
+@functools.cache
+def get_city_geocoder_wards() -> pd.Series:
+    """
+    Get the ward index for the city geocoder, loaded the first time it's needed rather than on
+    import. Reuses the cached index if the xlsx's modified time or hash matches the one it was
+    built from, and otherwise parses the xlsx and caches the new index
+    """
+    modified_time = os.stat(city_geocoder_path).st_mtime_ns
+    cache = load_cached_ward_index()
+
+    if cache is not None and cache["modified_time"] == modified_time:
+        return cache["wards"]
+
+    # The modified time changes on checkout, so check the contents before reparsing
+    geocoder_hash = hash_file(city_geocoder_path)
+
+    if cache is not None and cache["hash"] == geocoder_hash:
+        save_cached_ward_index({**cache, "modified_time": modified_time})
+        return cache["wards"]
+
+    wards = build_ward_index(pd.read_excel(city_geocoder_path))
+    save_cached_ward_index(
+        {"modified_time": modified_time, "hash": geocoder_hash, "wards": wards}
+    )
+
+    return wards
+
+
+@functools.cache
+def get_ward_boundaries() -> tuple[shapely.STRtree, np.ndarray] | None:
+    """
+    Get a spatial index of the ward boundaries and the ward number of each boundary in it, loaded the
+    first time it's needed. None if we don't have a ward boundaries file
+    """
+    if not os.path.exists(ward_boundaries_path):
         return None
-    return int(row["Wards (Current - 2023)"])
+
+    boundaries = fetch_geojson_coordinates(ward_boundaries_path)
+
+    if boundaries is None:
+        return None
+
+    features = boundaries["features"]
+    polygons = [shape(feature["geometry"]) for feature in features]
+    ward_numbers = np.array(
+        [
+            int(
+                feature["properties"][ward_boundary_property].removeprefix(
+                    ward_boundary_prefix
+                )
+            )
+            for feature in features
+        ]
+    )
+
+    return shapely.STRtree(polygons), ward_numbers
+
+
+def find_wards_by_location(
+    buildings: pd.DataFrame, ward_tree: shapely.STRtree, ward_numbers: np.ndarray
+) -> pd.Series:
+    """
+    Finds the ward each building is in from its Latitude and Longitude, with a single query of the
+    ward boundaries' spatial index. NaN for buildings without a location or outside every ward
+    """
+    latitudes = np.asarray(
+        pd.to_numeric(buildings["Latitude"], errors="coerce"), dtype=float
+    )
+    longitudes = np.asarray(
+        pd.to_numeric(buildings["Longitude"], errors="coerce"), dtype=float
+    )
+    wards = pd.Series(np.nan, index=buildings.index)
+
+    located_rows = np.flatnonzero(~(np.isnan(latitudes) | np.isnan(longitudes)))
+    points = shapely.points(longitudes[located_rows], latitudes[located_rows])
+
+    # Intersects rather than within, so buildings right on a ward boundary still get a ward
+    point_indices, ward_indices = ward_tree.query(points, predicate="intersects")
+
+    # A building on a boundary between two wards matches both, so just use the first
+    point_indices, first_matches = np.unique(point_indices, return_index=True)
+    wards.iloc[located_rows[point_indices]] = ward_numbers[ward_indices[first_matches]]
+
+    return wards
+
+
+def find_ward_number_by_city_geocoder(address: str) -> int | None:
+    """Finds ward number for a given address provided by the city geocoder"""
+    ward_number = get_city_geocoder_wards().get(address)
+
+    if ward_number is None:
+        return None
+    return int(ward_number)
 
 
 def add_ward_numbers(buildings: pd.DataFrame) -> pd.DataFrame:
     """Generates geocodes and ward numbers in a Data Frame of buildings"""
-    # Find corresponding Ward number for each building based on benchmark data coordinates, using WardsShapes information
-    # First based on benchmark data coordinates, then based on Google Maps Geocoding API coordinates
-    buildings["Ward"] = buildings.apply(
-        lambda building: find_ward_number_by_city_geocoder(building["Address"]), axis=1
-    )
+    # Find corresponding Ward number for each building by looking up its address in the city
+    # geocoder's wards
+    buildings["Ward"] = buildings.loc[:, "Address"].map(get_city_geocoder_wards())
+
+    # For addresses the geocoder doesn't have, find the ward the building's location is in
+    not_geocoded = buildings.loc[:, "Ward"].isna()
+    ward_boundaries = get_ward_boundaries()
+
+    if not_geocoded.any() and ward_boundaries is not None:
+        buildings.loc[not_geocoded, "Ward"] = find_wards_by_location(
+            buildings.loc[not_geocoded], *ward_boundaries
+        )
 
     # Convert 'Ward' columns to int, handling any NaN values as -1
     buildings["Ward"] = buildings["Ward"].fillna(-1).astype(int)
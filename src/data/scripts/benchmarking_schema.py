@@ -0,0 +1,100 @@
+"""
+Benchmarking Schema - The columns of the City of Chicago's benchmarking data and the types we read
+them as
+
+Declaring each column's type up front lets pandas parse it straight to that type in a single pass
+(including numbers formatted with commas, like "1,234.5"), instead of inferring types and leaving
+each step to convert its columns afterwards. Types are declared under our column names and also
+apply under the city's original headers, so they're used for both the source CSV and the CSVs our
+pipeline steps write.
+"""
+
+# The city's column headers, in the order of their CSV, and the names we rename them to, since
+# GraphQL doesn't allow spaces or units in field names
+replace_headers = {
+    "Data Year": "DataYear",
+    "ID": "ID",
+    "Property Name": "PropertyName",
+    "Reporting Status": "ReportingStatus",
+    "Address": "Address",
+    "ZIP Code": "ZIPCode",
+    "Chicago Energy Rating": "ChicagoEnergyRating",
+    "Exempt From Chicago Energy Rating": "ExemptFromChicagoEnergyRating",
+    "Community Area": "CommunityArea",
+    "Primary Property Type": "PrimaryPropertyType",
+    "Gross Floor Area - Buildings (sq ft)": "GrossFloorArea",
+    "Year Built": "YearBuilt",
+    "# of Buildings": "NumberOfBuildings",
+    "Water Use (kGal)": "WaterUse",
+    "ENERGY STAR Score": "ENERGYSTARScore",
+    "Electricity Use (kBtu)": "ElectricityUse",
+    "Natural Gas Use (kBtu)": "NaturalGasUse",
+    "District Steam Use (kBtu)": "DistrictSteamUse",
+    "District Chilled Water Use (kBtu)": "DistrictChilledWaterUse",
+    "All Other Fuel Use (kBtu)": "AllOtherFuelUse",
+    "Site EUI (kBtu/sq ft)": "SiteEUI",
+    "Source EUI (kBtu/sq ft)": "SourceEUI",
+    "Weather Normalized Site EUI (kBtu/sq ft)": "WeatherNormalizedSiteEUI",
+    "Weather Normalized Source EUI (kBtu/sq ft)": "WeatherNormalizedSourceEUI",
+    "Total GHG Emissions (Metric Tons CO2e)": "TotalGHGEmissions",
+    "GHG Intensity (kg CO2e/sq ft)": "GHGIntensity",
+    "Latitude": "Latitude",
+    "Longitude": "Longitude",
+    "Location": "Location",
+    "Row_ID": "Row_ID",
+}
+
+# Names and categories, read as plain strings (a ZIP code may be "60614" or "60614-1234")
+text_cols = [
+    "PropertyName",
+    "ReportingStatus",
+    "Address",
+    "ZIPCode",
+    "CommunityArea",
+    "PrimaryPropertyType",
+    "Location",
+    "Row_ID",
+]
+
+# Values we only pass through, kept as the exact text the city gave us. Coordinates can change
+# their last digits if parsed as floats, and the exempt flag would be parsed as a boolean with a
+# warning about mixed types
+verbatim_cols = [
+    "ExemptFromChicagoEnergyRating",
+    "Latitude",
+    "Longitude",
+]
+
+# Whole numbers that every row should have. They're read as nullable ints, so that a row missing one
+# doesn't stop the whole file from being read, and get_and_clean_csv drops any such rows
+required_int_cols = [
+    "DataYear",
+    "ID",
+]
+
+# Every other column is a number. That includes the benchmarking_int_cols in building_utils, which
+# can be blank, so they're read as floats and only cast to nullable ints once they're cleaned
+number_cols = [
+    col
+    for col in replace_headers.values()
+    if col not in text_cols + verbatim_cols + required_int_cols
+]
+
+# The type of each column, by our column names
+column_dtypes = {
+    **{col: str for col in text_cols},
+    **{col: "string" for col in verbatim_cols},
+    **{col: "Int64" for col in required_int_cols},
+    **{col: "float64" for col in number_cols},
+}
+
+# The type of each column by both our names and the city's headers, for reading any of our CSVs
+csv_dtypes = {
+    **column_dtypes,
+    **{header: column_dtypes[col] for header, col in replace_headers.items()},
+}
+
+# The required whole number columns by both our names and the city's headers
+required_int_csv_cols = set(required_int_cols) | {
+    header for header, col in replace_headers.items() if col in required_int_cols
+}
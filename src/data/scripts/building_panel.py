@@ -0,0 +1,127 @@
+"""
+Building Panel - The all years data as a dense (building x year) panel
+
+The all years data has a row per building per year, so working out anything about each building's
+history (how it changed year over year, which years it reported, its latest year) otherwise takes a
+groupby or merge for every calculation. Since there are only a few thousand buildings and a dozen or
+so years, we can instead lay each column out as a matrix with a row per building and a column per
+year, built in one pass, so those calculations work on whole NumPy arrays at once.
+
+Steps share one panel per all years frame (see get_building_panel), each adding the columns it needs,
+so working out each building's row and year's column is only done once per run.
+"""
+
+import weakref
+from typing import Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+
+
+class BuildingPanel:
+    """
+    Columns of the historic data as (building x year) matrices, with a row for each building ID and
+    a column for each year in the data, both in sorted order. Years a building has no record for are
+    NaN. If a building somehow has more than one record for a year, its largest value for that year
+    is used (so for a flag, whether any of its records have it), ignoring missing values.
+
+    Attributes:
+        building_ids: The building ID of each row, which also looks up a building's row (see
+            get_rows)
+        years: The year of each column
+        has_record: Whether each building has a record for each year
+    """
+
+    def __init__(self, historic_data: pd.DataFrame, columns: List[str]) -> None:
+        building_ids, self._rows = np.unique(historic_data["ID"], return_inverse=True)
+        years, self._cols = np.unique(historic_data["DataYear"], return_inverse=True)
+
+        self.building_ids = pd.Index(building_ids, name="ID")
+        self.years = years
+
+        self.has_record = np.zeros((len(building_ids), len(years)), dtype=bool)
+        self.has_record[self._rows, self._cols] = True
+
+        self._values: Dict[str, np.ndarray] = {}
+
+        for col in columns:
+            self.add_column(col, historic_data.loc[:, col])
+
+    def add_column(self, name: str, values: pd.Series) -> np.ndarray:
+        """
+        Lay out a value for each row of the historic data the panel was built from (e.g. one of its
+        columns, or a flag worked out from them) as a (building x year) matrix, returning it
+        """
+        matrix = np.full(self.has_record.shape, np.nan)
+
+        # fmax so duplicate records for a year use the largest value rather than the last one
+        np.fmax.at(
+            matrix,
+            (self._rows, self._cols),
+            values.to_numpy(dtype=float, na_value=np.nan),
+        )
+
+        self._values[name] = matrix
+
+        return matrix
+
+    def get_column(self, name: str, get_values: Callable[[], pd.Series]) -> np.ndarray:
+        """Get a column's matrix, adding it from get_values() if the panel doesn't have it yet"""
+        if name in self._values:
+            return self._values[name]
+
+        return self.add_column(name, get_values())
+
+    def __getitem__(self, col: str) -> np.ndarray:
+        """Get a column's (building x year) matrix"""
+        return self._values[col]
+
+    def __contains__(self, col: str) -> bool:
+        return col in self._values
+
+    def get_rows(self, ids) -> np.ndarray:
+        """Get the row of each of the given building IDs, or -1 if we don't have the building"""
+        return self.building_ids.get_indexer(ids)
+
+    def by_building(self, values: np.ndarray, name: str | None = None) -> pd.Series:
+        """Turn an array with a value for each building (row) into a Series indexed by ID"""
+        return pd.Series(values, index=self.building_ids, name=name)
+
+    def first_years(self, mask: np.ndarray) -> np.ndarray:
+        """
+        Get the first year each building is True in a (building x year) mask, e.g. the years it
+        reported data. Buildings without any get the first year of data, so filter those out
+        """
+        if self.years.size == 0:
+            return self.years
+
+        return self.years[mask.argmax(axis=1)]
+
+    def last_years(self, mask: np.ndarray) -> np.ndarray:
+        """Get the last year each building is True in a (building x year) mask (see first_years)"""
+        if self.years.size == 0:
+            return self.years
+
+        return self.years[-1 - mask[:, ::-1].argmax(axis=1)]
+
+
+# The panel last built by get_building_panel, and the frame it was built from
+_shared_panel: tuple[weakref.ref, BuildingPanel] | None = None
+
+
+def get_building_panel(historic_data: pd.DataFrame) -> BuildingPanel:
+    """
+    Get the panel for an all years frame, reusing the one built for the same frame object (e.g. by
+    an earlier step in this run), so steps can add the columns they need to one shared panel rather
+    than each laying out the frame again. Since it's shared by frame, a frame shouldn't have its
+    rows or the columns in its panel changed in place once its panel is built
+    """
+    global _shared_panel
+
+    if _shared_panel is not None and _shared_panel[0]() is historic_data:
+        return _shared_panel[1]
+
+    panel = BuildingPanel(historic_data, [])
+    _shared_panel = (weakref.ref(historic_data), panel)
+
+    return panel
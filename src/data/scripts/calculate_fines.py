@@ -12,57 +12,130 @@ uv run python -m src.data.scripts.calculate_fines
 ```
 """
 
+import pandas as pd
+from typing import Dict
+
 from src.data.scripts.utils import (
-    get_and_clean_csv,
     get_data_file_path,
     log_step_completion,
     write_json_with_newline,
 )
+from src.data.scripts.pipeline_context import (
+    PipelineContext,
+    BUILDING_BENCHMARKS,
+    HISTORIC_DATA,
+    load_pipeline_frame,
+)
 
 # THe maximum fine a building would get from not complying in a year, from the official ordinance
 ANNUAL_MAX_FINE = 9200
 
-# We use the historic data (benchmarking all years) to get years that were and were not submitted
-historic_data_in_filename = "benchmarking-all-years.csv"
-
 output_filename = "fines-by-year.json"
 
 # Assume run in /data
 data_out_directory = "dist"
 
 
-def calculate_fines() -> list[str]:
+def get_property_types(
+    historic_data: pd.DataFrame, building_data: pd.DataFrame | None
+) -> pd.Series:
+    """
+    Get the property type of each row of the historic data, from its PrimaryPropertyType column if
+    it has one, or else looked up by ID in the building data, since the all years data doesn't have
+    property types (they're only in building-benchmarks.csv, for each building's latest year)
     """
-    Calculates fines that could have been collected
+    if "PrimaryPropertyType" in historic_data.columns:
+        return historic_data.loc[:, "PrimaryPropertyType"]
 
-    Returns an array of files written to
+    if building_data is None:
+        raise ValueError(
+            "Fines by property type need the building data to look up property types in"
+        )
+
+    property_types = building_data.set_index("ID").loc[:, "PrimaryPropertyType"]
+
+    return historic_data.loc[:, "ID"].map(property_types)
+
+
+def calculate_fines_by_year(
+    historic_data: pd.DataFrame,
+    max_fine_by_year: Dict[int, int] | None = None,
+    fine_by_property_type: Dict[str, int] | None = None,
+    building_data: pd.DataFrame | None = None,
+) -> dict:
     """
+    Calculates the fines that could have been collected each year from the given historic data,
+    under a fine model where each building that didn't submit gets:
 
-    # Read the built historic data
-    historic_data = get_and_clean_csv(
-        get_data_file_path(data_out_directory, historic_data_in_filename)
-    )
+    - The max fine for that year, from max_fine_by_year (ANNUAL_MAX_FINE for years not in it)
+    - Or if its property type is in fine_by_property_type, the fine for that property type, up to
+      the max fine for the year. Property types are looked up in building_data (see
+      get_property_types), which is only needed for this
+
+    This doesn't read or write any files, so scenarios can be run on the same data over and over.
+
+    Returns a dictionary like:
+
+    {
+      "2018": { "fines": 9_200_000, "count": 1_000 },
+      "total": { "count": ..., "fines": ... }
+    }
+    """
+    not_submitted = historic_data.loc[
+        historic_data["ReportingStatus"] == "Not Submitted"
+    ]
+    years = not_submitted.loc[:, "DataYear"]
+
+    fines = years.map(max_fine_by_year or {}).fillna(ANNUAL_MAX_FINE).astype("int64")
 
-    not_submitted = historic_data[historic_data["ReportingStatus"] == "Not Submitted"]
+    if fine_by_property_type:
+        property_types = get_property_types(not_submitted, building_data)
+        property_type_fines = property_types.map(fine_by_property_type)
 
-    yearly_counts_series = not_submitted.groupby("DataYear").size()
+        fines = property_type_fines.clip(upper=fines).fillna(fines).astype("int64")
+
+    fines_by_year = fines.groupby(years).agg(["sum", "size"])
 
-    # Built up a dictionary like:
-    #
-    # {
-    #   2018: { fines: 9_200_000, count: 1_000 },
-    #   total: { fines: ..., count: ... }
-    # }
     fines_dict = {}
 
-    for year, count in yearly_counts_series.items():
-        fines = count * ANNUAL_MAX_FINE
+    for year, year_fines in fines_by_year.iterrows():
+        fines_dict[str(year)] = {
+            "fines": int(year_fines["sum"]),
+            "count": int(year_fines["size"]),
+        }
+
+    fines_dict["total"] = {
+        "count": int(fines_by_year["size"].sum()),
+        "fines": int(fines_by_year["sum"].sum()),
+    }
+
+    return fines_dict
+
+
+def calculate_fines(
+    historic_data: pd.DataFrame | None = None,
+    max_fine_by_year: Dict[int, int] | None = None,
+    fine_by_property_type: Dict[str, int] | None = None,
+    building_data: pd.DataFrame | None = None,
+) -> list[str]:
+    """
+    Calculates fines that could have been collected, from the given historic data or the built
+    historic data CSV if not given, under the given fine model (see calculate_fines_by_year). For
+    fines by property type, the building data is loaded from building-benchmarks.csv if not given
 
-        fines_dict[str(year)] = {"fines": fines, "count": count}
+    Returns an array of files written to
+    """
 
-    total_count = int(yearly_counts_series.sum())
+    # Read the built historic data
+    if historic_data is None:
+        historic_data = load_pipeline_frame(HISTORIC_DATA)
 
-    fines_dict["total"] = {"count": total_count, "fines": total_count * ANNUAL_MAX_FINE}
+    if fine_by_property_type and building_data is None:
+        building_data = load_pipeline_frame(BUILDING_BENCHMARKS)
+
+    fines_dict = calculate_fines_by_year(
+        historic_data, max_fine_by_year, fine_by_property_type, building_data
+    )
 
     fines_output_path = get_data_file_path(data_out_directory, output_filename)
 
@@ -71,12 +144,15 @@ def calculate_fines() -> list[str]:
     return [fines_output_path]
 
 
-def main():
+def main(context: PipelineContext | None = None):
+    # Use the historic data in memory if run from run_all.py
+    historic_data = context.get(HISTORIC_DATA) if context is not None else None
+
     # Calculate fines based on non-submission
-    calculate_fines()
+    output_files = calculate_fines(historic_data)
 
     # Log completion of this step
-    log_step_completion(6, calculate_fines())
+    log_step_completion(6, output_files)
 
 
 if __name__ == "__main__":
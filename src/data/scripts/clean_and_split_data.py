@@ -13,37 +13,41 @@ Buildings that have never submitted data in any year are still included in the l
 by reported data.
 """
 
+import os
 import pandas as pd
 from src.data.scripts.utils import (
     get_and_clean_csv,
     get_data_file_path,
+    iter_csv_chunks,
     log_step_completion,
-    output_to_csv,
     correct_building_locations,
 )
+from src.data.scripts.benchmarking_schema import replace_headers
 from src.data.scripts.building_utils import (
     benchmarking_string_cols,
     benchmarking_int_cols,
 )
+from src.data.scripts.pipeline_context import (
+    PipelineContext,
+    NEWEST_DATA,
+    HISTORIC_DATA,
+    compact_frame,
+    save_pipeline_frame,
+)
 
 file_dir = "source"
-out_file_dir = "dist"
-debug_file_dir = "debug"
 
 # The source file we read from - this is the raw data from the city
 src_emissions_filename = "ChicagoEnergyBenchmarking.csv"
 
+# Set this environment variable (or pass --source-chunk-size to run_all.py) to a number of rows to
+# stream the source file in chunks of that size, rather than reading it all at once, for source files
+# too big to fit in memory (e.g. benchmarking data for many cities)
+source_chunk_size_env_var = "SOURCE_CHUNK_SIZE"
+
 # The geoJSON file we use to replace erroneous coordinates from the city's raw data
 src_verified_coordinates_filename = "benchmark_building_locations_fixed.geojson"
 
-# The output file we generate that has all columns, but just for the latest year reported, which
-# goes into the next step of the data pipeline
-newest_instances_out_filename = "benchmarking-all-newest-temp.csv"
-
-# The output file we generate with limited columns but for ALL years (reported and non-reported),
-# allowing us to track metrics (e.g. emissions, GHG intensity) over time, and reporting status
-all_years_out_filename = "benchmarking-all-years.csv"
-
 # The columns we want to have in our historical data output - we need the ID (to filter by a
 # particular building) and should then have columns of interest that change over time (so yes to
 # 'GHGIntensity', no to 'YearBuilt')
@@ -68,39 +72,6 @@ columns_to_track_over_time = [
     "WeatherNormalizedSourceEUI",
 ]
 
-replace_headers = {
-    "Data Year": "DataYear",
-    "ID": "ID",
-    "Property Name": "PropertyName",
-    "Reporting Status": "ReportingStatus",
-    "Address": "Address",
-    "ZIP Code": "ZIPCode",
-    "Chicago Energy Rating": "ChicagoEnergyRating",
-    "Exempt From Chicago Energy Rating": "ExemptFromChicagoEnergyRating",
-    "Community Area": "CommunityArea",
-    "Primary Property Type": "PrimaryPropertyType",
-    "Gross Floor Area - Buildings (sq ft)": "GrossFloorArea",
-    "Total GHG Emissions (Metric Tons CO2e)": "TotalGHGEmissions",
-    "GHG Intensity (kg CO2e/sq ft)": "GHGIntensity",
-    "Year Built": "YearBuilt",
-    "# of Buildings": "NumberOfBuildings",
-    "Water Use (kGal)": "WaterUse",
-    "ENERGY STAR Score": "ENERGYSTARScore",
-    "Electricity Use (kBtu)": "ElectricityUse",
-    "Natural Gas Use (kBtu)": "NaturalGasUse",
-    "District Steam Use (kBtu)": "DistrictSteamUse",
-    "District Chilled Water Use (kBtu)": "DistrictChilledWaterUse",
-    "All Other Fuel Use (kBtu)": "AllOtherFuelUse",
-    "Site EUI (kBtu/sq ft)": "SiteEUI",
-    "Source EUI (kBtu/sq ft)": "SourceEUI",
-    "Weather Normalized Site EUI (kBtu/sq ft)": "WeatherNormalizedSiteEUI",
-    "Weather Normalized Source EUI (kBtu/sq ft)": "WeatherNormalizedSourceEUI",
-    "Latitude": "Latitude",
-    "Longitude": "Longitude",
-    "Location": "Location",
-    "Row_ID": "Row_ID",
-}
-
 
 def rename_columns(building_data: pd.DataFrame) -> pd.DataFrame:
     return building_data.rename(columns=replace_headers)
@@ -188,12 +159,21 @@ def fix_int_cols(building_data: pd.DataFrame) -> pd.DataFrame:
     return building_data
 
 
-def process(file_path: str, latest_year_only: bool) -> pd.DataFrame:
-    """Process an input file, renaming columns and applying filters based on whether we are getting
-    only the latest year for each building or all historic data"""
-    building_data = get_and_clean_csv(file_path)
+def load_source_data(file_path: str) -> pd.DataFrame:
+    """Read the city's benchmarking CSV and rename its columns"""
+    # Only read the columns we know, so a new column from the city can't sneak into our outputs
+    building_data = get_and_clean_csv(file_path, list(replace_headers))
+
+    return rename_columns(building_data)
 
-    building_data = rename_columns(building_data)
+
+def process_source_data(
+    building_data: pd.DataFrame, latest_year_only: bool
+) -> pd.DataFrame:
+    """Apply filters to the city's data (from load_source_data) based on whether we are getting
+    only the latest year for each building or all historic data. Works on a copy, so the data only
+    has to be read once to be processed both ways"""
+    building_data = building_data.copy()
 
     # Fix any incorrect coordinate data
     if latest_year_only:
@@ -206,10 +186,13 @@ def process(file_path: str, latest_year_only: bool) -> pd.DataFrame:
 
     # Used to be fix_str_cols(cleaned_data, building_data) when this was below the filtering
     cleaned_data = fix_str_cols(building_data, building_data)
-    cleaned_data = fix_int_cols(cleaned_data)
 
     # Only filter to the latest reporting year if that's the file we're generating
     if latest_year_only:
+        # The all years data keeps the int columns as parsed, since process_data grades it and
+        # writes it back out in its final form
+        building_data = fix_int_cols(building_data)
+
         submitted_data = get_buildings_with_ghg_intensity(building_data)
         submitted_data = get_submitted_data(submitted_data)
         submitted_data = get_last_year_data(submitted_data)
@@ -227,22 +210,115 @@ def process(file_path: str, latest_year_only: bool) -> pd.DataFrame:
     return cleaned_data
 
 
-def main() -> None:
-    processed_latest_year = process(
-        get_data_file_path(file_dir, src_emissions_filename), True
+def get_source_chunk_size() -> int | None:
+    """Get the number of rows to stream the source file in, or None to read it all at once"""
+    chunk_size = os.environ.get(source_chunk_size_env_var)
+
+    if not chunk_size:
+        return None
+
+    if not chunk_size.isdigit() or int(chunk_size) < 1:
+        raise ValueError(
+            f"{source_chunk_size_env_var} must be a positive number of rows, got '{chunk_size}'"
+        )
+
+    return int(chunk_size)
+
+
+def keep_last_year_data(
+    kept_data: pd.DataFrame | None, chunk: pd.DataFrame
+) -> pd.DataFrame:
+    """Get each building's latest row from the rows kept from earlier chunks and a new chunk"""
+    if kept_data is not None:
+        chunk = pd.concat([kept_data, chunk])
+
+    return get_last_year_data(chunk)
+
+
+def process_source_data_in_chunks(
+    file_path: str, chunk_size: int
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Process the city's CSV chunk_size rows at a time, returning the same latest year and all years
+    data as process_source_data. Between chunks we only keep each building's latest submission and
+    latest row (for buildings that never submit), plus the columns we track over time for every
+    row, so memory is bounded by the number of buildings rather than the number of rows"""
+    latest_submitted_data = None
+    latest_data = None
+    historic_chunks = []
+
+    for chunk in iter_csv_chunks(file_path, chunk_size, list(replace_headers)):
+        chunk = rename_columns(chunk)
+        chunk = fix_str_cols(chunk, chunk)
+
+        historic_chunks.append(filter_cols_historic(chunk))
+
+        submitted_data = get_submitted_data(get_buildings_with_ghg_intensity(chunk))
+        latest_submitted_data = keep_last_year_data(
+            latest_submitted_data, submitted_data
+        )
+        latest_data = keep_last_year_data(latest_data, chunk)
+
+    if latest_submitted_data is None or latest_data is None:
+        raise ValueError(f"No building data found in {file_path}")
+
+    # Buildings that have never submitted data have no rows in the submitted data, but we still
+    # want them present (with blank metrics) so they're searchable
+    never_submitted_data = latest_data.loc[
+        ~latest_data["ID"].isin(latest_submitted_data["ID"])
+    ]
+
+    latest_year_data = pd.concat(
+        [latest_submitted_data, never_submitted_data], ignore_index=True
     )
-    processed_all_years = process(
-        get_data_file_path(file_dir, src_emissions_filename), False
+
+    # Fix any incorrect coordinate data, which only has to be done for the rows we kept
+    latest_year_data = correct_building_locations(
+        latest_year_data,
+        get_data_file_path(file_dir, src_verified_coordinates_filename),
     )
+    latest_year_data = fix_int_cols(fix_str_cols(latest_year_data, latest_year_data))
+
+    return latest_year_data, pd.concat(historic_chunks)
+
+
+def process(file_path: str, latest_year_only: bool) -> pd.DataFrame:
+    """Process an input file, renaming columns and applying filters based on whether we are getting
+    only the latest year for each building or all historic data"""
+    return process_source_data(load_source_data(file_path), latest_year_only)
+
+
+def main(context: PipelineContext | None = None) -> None:
+    src_emissions_path = get_data_file_path(file_dir, src_emissions_filename)
+    source_chunk_size = get_source_chunk_size()
+
+    if source_chunk_size is not None:
+        processed_latest_year, processed_all_years = process_source_data_in_chunks(
+            src_emissions_path, source_chunk_size
+        )
+    else:
+        # Read the city's data once, then split it into the latest year and all years data
+        building_data = load_source_data(src_emissions_path)
+
+        processed_latest_year = process_source_data(building_data, True)
+        processed_all_years = process_source_data(building_data, False)
+
+    # Every later step reads the all years data, so store it compactly
+    processed_all_years = compact_frame(HISTORIC_DATA, processed_all_years)
+
+    # If run as part of the full pipeline, hand the data to the next steps in memory, run_all.py
+    # writes it out at the end
+    if context is not None:
+        context.set(NEWEST_DATA, processed_latest_year)
+        context.set(HISTORIC_DATA, processed_all_years)
 
-    newest_out_path = get_data_file_path(debug_file_dir, newest_instances_out_filename)
-    all_years_out_path = get_data_file_path(out_file_dir, all_years_out_filename)
+        log_step_completion(1, [])
+        return
 
-    # Output the latest year data to source, since other processing steps still get applied
-    output_to_csv(processed_latest_year, newest_out_path)
+    # Output the latest year data to debug, since other processing steps still get applied
+    newest_out_path = save_pipeline_frame(NEWEST_DATA, processed_latest_year)
 
     # The all years data is in it's final form already, we don't do ranks or stats off of it (yet)
-    output_to_csv(processed_all_years, all_years_out_path)
+    all_years_out_path = save_pipeline_frame(HISTORIC_DATA, processed_all_years)
 
     log_step_completion(1, [newest_out_path, all_years_out_path])
 
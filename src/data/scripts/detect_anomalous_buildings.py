@@ -8,19 +8,29 @@ This includes:
 
 - Natural Gas Reported 0 but Was Non-Zero Before (e.g. Moody Solheim Center as of 2022, ID 165717)
   These buildings score
+- Large Swings in Natural Gas Use from one year to the next
+- Outlier Years in energy use, EUI or GHG intensity, far off from the years around them (see
+  find_outlier_years)
+
+Each anomaly has a detector in `anomaly_detectors`, which all check the same summary of each
+building's history (see get_building_history), so adding a new type of anomaly only needs a new
+column in that summary and a detector.
 """
 
-from typing import List, Optional
+import functools
+import warnings
+from typing import Callable, Dict, List, Optional
+import numpy as np
 import pandas as pd
 
-from src.data.scripts.utils import (
-    get_data_file_path,
-    log_step_completion,
-    output_to_csv,
-)
-from src.data.scripts.building_utils import (
-    benchmarking_string_cols,
-    benchmarking_int_cols,
+from src.data.scripts.building_panel import get_building_panel
+from src.data.scripts.utils import log_step_completion
+from src.data.scripts.pipeline_context import (
+    PipelineContext,
+    BUILDING_BENCHMARKS,
+    HISTORIC_DATA,
+    load_pipeline_frame,
+    save_pipeline_frame,
 )
 
 
@@ -29,8 +39,39 @@ from src.data.scripts.building_utils import (
 anomaly_values = {
     "zero_gas_but_prev_use": "gas:zero-with-prev-use",
     "large_gas_swing": "gas:large-swings",
+    "electricity_outlier_year": "electricity:outlier-year",
+    "gas_outlier_year": "gas:outlier-year",
+    "steam_outlier_year": "steam:outlier-year",
+    "site_eui_outlier_year": "site-eui:outlier-year",
+    "ghg_intensity_outlier_year": "ghg-intensity:outlier-year",
+}
+
+# The columns we look for outlier years in, and the anomaly_values key for a building with one
+outlier_anomaly_keys = {
+    "ElectricityUse": "electricity_outlier_year",
+    "NaturalGasUse": "gas_outlier_year",
+    "DistrictSteamUse": "steam_outlier_year",
+    "SiteEUI": "site_eui_outlier_year",
+    "GHGIntensity": "ghg_intensity_outlier_year",
 }
 
+# How many years around each year (including itself) we compare it to for outliers, and how many of
+# them need reported values to judge it at all
+outlier_window_years = 5
+outlier_min_years = 3
+
+# How many robust standard deviations (see find_outlier_years) a year has to be from the median of
+# the years around it to be an outlier. 3.5 is the usual cutoff for this "modified z-score"
+outlier_score_threshold = 3.5
+
+# The smallest robust standard deviation we allow, as a share of the median (e.g. 20% is 0.2), so
+# buildings with very steady use aren't flagged for ordinary changes. With our score threshold, a
+# year always has to be at least 70% off of the years around it, like our gas swing threshold
+outlier_min_deviation_share = 0.2
+
+# Scales the median absolute deviation (MAD) to match a standard deviation for normal data
+mad_to_standard_deviation = 1.4826
+
 # The relative share of electric use that a building's gas use has to meet to be marked as
 # having used gas (e.g. 5% is 0.05). This should apply as a safeguard to all types of gas anomaly
 # checks, since going from 5% to 0% shouldn't be flagged, nor 0% to 5%
@@ -42,14 +83,6 @@ anomaly_values = {
 #   energy use, every other year was less
 gas_use_min_share_decimal = 0.10
 
-out_dir = "dist"
-
-# Input historic data from Step 1
-input_historic_data_csv_path = get_data_file_path(out_dir, "benchmarking-all-years.csv")
-
-# Output main benchmark path
-input_benchmark_data_csv_path = get_data_file_path(out_dir, "building-benchmarks.csv")
-
 
 def detect_gas_users(historic_data: pd.DataFrame) -> pd.DataFrame:
     """
@@ -64,13 +97,19 @@ def detect_gas_users(historic_data: pd.DataFrame) -> pd.DataFrame:
     should not be flagged.
     """
 
-    # Handle cases where electricity use is zero to avoid division by zero errors
-    used_gas_before = historic_data.loc[
+    return historic_data.loc[is_gas_user(historic_data)]
+
+
+def is_gas_user(historic_data: pd.DataFrame) -> pd.Series:
+    """
+    Whether each row of the historic data used a noticeable amount of natural gas (see
+    detect_gas_users)
+    """
+    # Compare to a share of electric use rather than dividing by it, to avoid division by zero errors
+    return (
         historic_data["NaturalGasUse"]
         > gas_use_min_share_decimal * historic_data["ElectricityUse"]
-    ]
-
-    return used_gas_before
+    )
 
 
 def determine_abs_delta(x: pd.Series) -> Optional[float]:
@@ -90,155 +129,297 @@ def determine_abs_delta(x: pd.Series) -> Optional[float]:
     return delta.max()
 
 
-def detect_large_gas_swing_buildings(
-    historic_data: pd.DataFrame, threshold: float = 0.7
-) -> List[int]:
+def calculate_max_gas_deltas(gas_users: pd.DataFrame) -> pd.Series:
     """
-    Finds buildings in the given historic data DataFrame that sees reported gas use change greater
-    than 100% in a given year in the past, as this is highly likely to be incorrect.
-    The results are sorted from high to low.
+    A vectorized determine_abs_delta, calculating the maximum absolute percentage change in
+    NaturalGasUse for every building at once instead of calling back into Python per building.
+    Like determine_abs_delta, each building's rows are compared in the order given, which for our
+    historic data is by year.
 
-    args:
-        historic_data: the dataframe to analyze
-        threshold: the percent threshold to detect buildings at (1 = 100%)
+    Returns a Series of each building's maximum change, indexed by ID
+    """
+    gas_use = gas_users["NaturalGasUse"]
+    gas_by_building = gas_use.groupby(gas_users["ID"])
 
-    returns:
-        a list of building IDs that have anomalous gas use
+    # Each year's change from the year before (+1 so a use of 0 can't divide by 0), with a
+    # building's first year compared to itself. Gas users always report gas use, so there are no
+    # missing values to fill besides the first year's
+    previous_use = gas_by_building.shift(1).fillna(gas_use) + 1
+    delta = ((gas_use - previous_use) / previous_use).abs()
+
+    max_deltas = delta.groupby(gas_users["ID"]).max()
+
+    # Buildings that only reported no gas use had no change
+    reported_gas_use = gas_use.ne(0) & gas_use.notna()
+    used_gas = reported_gas_use.groupby(gas_users["ID"]).any()
+
+    return max_deltas.where(used_gas, 0.0)
+
+
+def find_outlier_years(values: np.ndarray) -> np.ndarray:
     """
+    Finds outlier years in a (building x year) matrix of one column's values, for every building at
+    once, with a Hampel filter.
 
-    # Ignore buildings with a very small share of gas use
-    gas_users = detect_gas_users(historic_data)
+    Each year is compared to the rolling median of the outlier_window_years centered on it, scoring
+    how many robust standard deviations (the rolling median absolute deviation, scaled to match a
+    standard deviation) it's off by. Years with fewer than outlier_min_years reported around them,
+    or that have nothing to compare to (e.g. always 0), are never outliers.
 
-    gas_grouped = gas_users.groupby("ID").agg({"NaturalGasUse": determine_abs_delta})
+    Returns a boolean matrix the same shape as the values, True for each outlier year
+    """
+    half_window = outlier_window_years // 2
+    padded_values = np.pad(
+        values.astype(float),
+        ((0, 0), (half_window, half_window)),
+        constant_values=np.nan,
+    )
+    # Each year's window of values around it, as a (building x year x window) view
+    windows = np.lib.stride_tricks.sliding_window_view(
+        padded_values, outlier_window_years, axis=1
+    )
 
-    # Ensure we have a DataFrame and reset index
-    gas_df = pd.DataFrame(gas_grouped).reset_index()
+    with warnings.catch_warnings():
+        # Windows without any reported values have no median, which are never outliers anyway
+        warnings.simplefilter("ignore", category=RuntimeWarning)
 
-    # Sort and filter
-    anom_gas_usage = (
-        gas_df.sort_values("NaturalGasUse", ascending=False)
-        .dropna()
-        .rename(columns={"NaturalGasUse": "NaturalGasChange"})
+        rolling_median = np.nanmedian(windows, axis=2)
+        rolling_mad = np.nanmedian(
+            np.abs(windows - rolling_median[..., np.newaxis]), axis=2
+        )
+
+    deviation = np.maximum(
+        mad_to_standard_deviation * rolling_mad,
+        outlier_min_deviation_share * np.abs(rolling_median),
+    )
+    reported_years = np.count_nonzero(~np.isnan(windows), axis=2)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scores = np.abs(values - rolling_median) / deviation
+
+    return (
+        (reported_years >= outlier_min_years)
+        & (deviation > 0)
+        & (scores > outlier_score_threshold)
+    )
+
+
+def get_building_history(historic_data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Summarizes each building's history for our anomaly detectors, going over each building's years
+    in order just once, so detectors don't each have to filter and group the historic data again.
+
+    Returns a DataFrame indexed by building ID, with:
+    - MaxGasChange: The largest change in gas use from one year to the next (see
+      calculate_max_gas_deltas), over the years the building was a gas user (NaN if never)
+    - UsedGasBeforeLatestYear: Whether the building was a gas user before the latest year of data
+    - ReportedLatestYear: Whether the building has a record for the latest year of data
+    - LatestYearGasUse: The building's gas use in the latest year of data (NaN if not reported)
+    - <Column>OutlierYears: How many outlier years (see find_outlier_years) the building has in each
+      of our outlier_anomaly_keys columns (0 if the data doesn't have that column)
+    """
+    panel = get_building_panel(historic_data)
+    gas_use = panel.get_column(
+        "NaturalGasUse", lambda: historic_data.loc[:, "NaturalGasUse"]
     )
+    is_gas_user_row = is_gas_user(historic_data)
+    used_gas = panel.get_column("UsedGas", lambda: is_gas_user_row) == 1
+
+    # Gas changes are between the years each building was a gas user, in order
+    gas_users = historic_data.loc[is_gas_user_row]
+    gas_users = gas_users.sort_values(["ID", "DataYear"], kind="stable")
+
+    building_history = pd.DataFrame(
+        {
+            "MaxGasChange": calculate_max_gas_deltas(gas_users),
+            # The last column of the panel is the latest year of data
+            "UsedGasBeforeLatestYear": used_gas[:, :-1].any(axis=1),
+            "ReportedLatestYear": panel.has_record[:, -1],
+            "LatestYearGasUse": gas_use[:, -1],
+        },
+        index=panel.building_ids,
+    )
+
+    for col in outlier_anomaly_keys:
+        if col in historic_data.columns:
+            values_by_year = panel.get_column(col, lambda: historic_data.loc[:, col])
+            building_history[f"{col}OutlierYears"] = find_outlier_years(
+                values_by_year
+            ).sum(axis=1)
+        else:
+            building_history[f"{col}OutlierYears"] = 0
+
+    return building_history
 
-    filtered_data = anom_gas_usage[anom_gas_usage.NaturalGasChange > threshold]
-    anom_ids = pd.Series(filtered_data["ID"]).unique().tolist()
+
+def has_large_gas_swing(
+    building_history: pd.DataFrame, threshold: float = 0.7
+) -> pd.Series:
+    """
+    Whether each building saw its reported gas use change by more than the threshold (1 = 100%) in a
+    year in the past, as this is highly likely to be incorrect.
+    """
+    large_swings = building_history["MaxGasChange"] > threshold
 
     thresh_prcnt = round(threshold * 100)
     print(
-        f"- {len(anom_ids)} buildings with large (> {thresh_prcnt}%) swings in gas use."
+        f"- {large_swings.sum()} buildings with large (> {thresh_prcnt}%) swings in gas use."
     )
 
-    return anom_ids
+    return large_swings
 
 
-def detect_anomalous_zero_gas_buildings(historic_data: pd.DataFrame) -> List[int]:
+def has_zero_gas_but_prev_use(building_history: pd.DataFrame) -> pd.Series:
     """
-    Finds buildings in the given historic data DataFrame that reported 0 gas use in the latest year,
-    (which we'd mark as gas free) but reported gas use in the past, as this is highly likely to be
-    incorrect. Buildings that dip to 0 but come back are caught by our large swing detector.
+    Whether each building reported 0 gas use in the latest year (which we'd mark as gas free) but
+    reported gas use in the past, as this is highly likely to be incorrect. Buildings that dip to 0
+    but come back are caught by our large swing detector.
+
+    If a building used a noticeable amount of gas relative to its total energy use (see
+    detect_gas_users), we flag it as having used gas. This prevents us flagging buildings that went
+    from using very little gas to zero, which is likely not an error, but could come from an
+    individual tenant using gas or only kitchens using gas and then going electric
     """
+    zero_gas_anomalies = (
+        building_history["ReportedLatestYear"]
+        & building_history["LatestYearGasUse"].fillna(0).eq(0)
+        & building_history["UsedGasBeforeLatestYear"]
+    )
 
-    latest_year = historic_data["DataYear"].max()
+    print(
+        f"- {zero_gas_anomalies.sum()} buildings with anomalous zero gas use in the latest year."
+    )
 
-    no_gas_use_ids = (
-        historic_data[
-            (historic_data["NaturalGasUse"] == 0)
-            | historic_data["NaturalGasUse"].isna()
-        ].loc[historic_data["DataYear"] == latest_year]
-    )["ID"]
+    return zero_gas_anomalies
 
-    # If a building used a noticeable amount of gas relative to its total energy use (for
-    # simplicity, > 5% of their electric use), we flag it as having used gas. This prevents us
-    # flagging buildings that went from using very little gas to zero, which is likely not an error,
-    # but could come from an individual tenant using gas or only kitchens using gas and then going
-    # electric
-    old_records = historic_data.loc[historic_data["DataYear"] < latest_year]
 
-    used_gas_in_past = detect_gas_users(old_records)
+def has_outlier_years(building_history: pd.DataFrame, column: str) -> pd.Series:
+    """
+    Whether each building has any outlier years in a column (see find_outlier_years), like a year
+    of electric use far higher than the years around it, which is likely a reporting error
+    """
+    has_outliers = building_history[f"{column}OutlierYears"] > 0
 
-    gas_anomalies = used_gas_in_past.loc[historic_data["ID"].isin(no_gas_use_ids)]
+    print(f"- {has_outliers.sum()} buildings with outlier years in {column}.")
 
-    gas_anomaly_ids = gas_anomalies["ID"].unique().tolist()
+    return has_outliers
 
-    print(
-        f"- {len(gas_anomaly_ids)} buildings with anomalous zero gas use in {latest_year}."
-    )
 
-    return gas_anomaly_ids
+# The detectors for each anomaly, keyed by its anomaly_values key. Each gets the summary of every
+# building's history from get_building_history, and returns whether each building has the anomaly.
+# Buildings with multiple anomalies list them in this order
+anomaly_detectors: Dict[str, Callable[[pd.DataFrame], pd.Series]] = {
+    "zero_gas_but_prev_use": has_zero_gas_but_prev_use,
+    "large_gas_swing": has_large_gas_swing,
+    **{
+        anomaly_key: functools.partial(has_outlier_years, column=col)
+        for col, anomaly_key in outlier_anomaly_keys.items()
+    },
+}
+
+
+def detect_large_gas_swing_buildings(
+    historic_data: pd.DataFrame, threshold: float = 0.7
+) -> List[int]:
+    """
+    Finds buildings in the given historic data DataFrame that sees reported gas use change greater
+    than 100% in a given year in the past, as this is highly likely to be incorrect.
+    The results are sorted from high to low.
+
+    args:
+        historic_data: the dataframe to analyze
+        threshold: the percent threshold to detect buildings at (1 = 100%)
+
+    returns:
+        a list of building IDs that have anomalous gas use
+    """
+    building_history = get_building_history(historic_data)
+    large_swings = building_history.loc[
+        has_large_gas_swing(building_history, threshold)
+    ]
+
+    return large_swings.sort_values("MaxGasChange", ascending=False).index.tolist()
+
+
+def detect_anomalous_zero_gas_buildings(historic_data: pd.DataFrame) -> List[int]:
+    """
+    Finds buildings in the given historic data DataFrame that reported 0 gas use in the latest year,
+    but reported gas use in the past (see has_zero_gas_but_prev_use)
+    """
+    building_history = get_building_history(historic_data)
+
+    return building_history.index[has_zero_gas_but_prev_use(building_history)].tolist()
 
 
 def find_and_note_anomalies(
     building_data: pd.DataFrame, historic_data: pd.DataFrame
 ) -> pd.DataFrame:
     """
-    Calls our sub functions to find different types of anomalies and notates the anomalies they have
-    in a new 'DataAnomalies' column that we add to the benchmark data, with formatted strings based
-    off of our `anomaly_values`.
+    Runs each of our anomaly_detectors and notates the anomalies each building has in a new
+    'DataAnomalies' column that we add to the benchmark data, with formatted strings based off of
+    our `anomaly_values`, joined with commas if a building has multiple (e.g. "anomaly1,anomaly2").
 
     Return a DataFrame with our new column
     """
 
     print("Found Anomalies:\n")
 
-    zero_gas_anomaly_ids = detect_anomalous_zero_gas_buildings(historic_data)
-    gas_swing_ids = detect_large_gas_swing_buildings(historic_data)
+    building_history = get_building_history(historic_data)
 
-    print("")
+    # Each building's anomalies, each followed by a comma
+    building_anomalies = pd.Series("", index=building_history.index)
 
-    # Create the 'DataAnomalies' column and make it empty by default
-    building_data["DataAnomalies"] = ""
+    for anomaly_key, detect_anomaly in anomaly_detectors.items():
+        has_anomaly = detect_anomaly(building_history)
 
-    building_data.loc[building_data["ID"].isin(gas_swing_ids), "DataAnomalies"] = (
-        anomaly_values["large_gas_swing"]
-    )
+        building_anomalies = building_anomalies.mask(
+            has_anomaly, building_anomalies + anomaly_values[anomaly_key] + ","
+        )
+
+    print("")
 
-    # Buildings that have reported 0 use and then a value will be a subset of the gas swing
-    # buildings, but it's a more specific issue, so we mark it separately
-    building_data.loc[
-        building_data["ID"].isin(zero_gas_anomaly_ids), "DataAnomalies"
-    ] = anomaly_values["zero_gas_but_prev_use"]
+    building_data["DataAnomalies"] = (
+        building_data["ID"].map(building_anomalies.str.rstrip(",")).fillna("")
+    )
 
     return building_data
 
 
-def detect_anomalous_buildings():
+def detect_anomalous_buildings(context: PipelineContext | None = None):
     """
     The main function to anomalous buildings, and notates the anomalies they have in a new 'DataAnomalies'
     column that we add to the benchmark data, with formatted strings based off of our `anomaly_keys`
     and `anomaly_values`
+
+    Reads and updates the data in the pipeline context if given, otherwise the CSVs from the
+    previous steps
     """
 
-    # Load in historic data for anomaly detection
-    historic_data = pd.read_csv(input_historic_data_csv_path)
+    if context is not None:
+        historic_data = context.get(HISTORIC_DATA)
+        building_data = context.get(BUILDING_BENCHMARKS)
+    else:
+        # Load in historic data for anomaly detection
+        historic_data = load_pipeline_frame(HISTORIC_DATA)
 
-    # Load in full building data from previous step, where we store the anomaly data
-    building_data = pd.read_csv(input_benchmark_data_csv_path)
+        # Load in full building data from previous step, where we store the anomaly data
+        building_data = load_pipeline_frame(BUILDING_BENCHMARKS)
 
     building_data = find_and_note_anomalies(building_data, historic_data)
 
-    # Mark columns that look like numbers but should be strings as such to prevent decimals showing
-    # up (e.g. zipcode of 60614 or Ward 9) and make sure missing data is output as a string
-    building_data[benchmarking_string_cols] = (
-        building_data[benchmarking_string_cols].fillna("").astype(str)
-    )
-
-    # Mark columns as ints that should never show a decimal, e.g. Number of Buildings, Zipcode
-    building_data[benchmarking_int_cols] = building_data[benchmarking_int_cols].astype(
-        "Int64"
-    )
-
-    output_to_csv(building_data, input_benchmark_data_csv_path)
+    if context is not None:
+        context.set(BUILDING_BENCHMARKS, building_data)
+        return []
 
-    return [input_benchmark_data_csv_path]
+    return [save_pipeline_frame(BUILDING_BENCHMARKS, building_data)]
 
 
 ###
 ### Main
 ###
-def main() -> None:
+def main(context: PipelineContext | None = None) -> None:
     outputted_paths = []
-    outputted_paths += detect_anomalous_buildings()
+    outputted_paths += detect_anomalous_buildings(context)
 
     log_step_completion(4, outputted_paths)
 
@@ -7,13 +7,18 @@ into year-over-year statistical insights used for analysis and visualization.
 
 import math
 import pandas
-from typing import List, Dict
+from typing import Any, Iterator, List, Tuple
+from src.data.scripts.building_panel import get_building_panel
 from src.data.scripts.utils import (
-    get_and_clean_csv,
     get_data_file_path,
     log_step_completion,
     write_json_with_newline,
 )
+from src.data.scripts.pipeline_context import (
+    PipelineContext,
+    HISTORIC_DATA,
+    load_pipeline_frame,
+)
 
 # DO NOT LEAVE TRUE ON `master`
 debug = False
@@ -28,10 +33,6 @@ data_out_directory = "dist"
 # The /debug directory is to have a well formatted JSON for reading
 data_debug_directory = "debug"
 
-# The input file from the previous step. Gatsby doesn't like spaces so we use a CSV with renamed
-# headers with no units
-building_emissions_file = "benchmarking-all-years.csv"
-
 # The final output file name
 building_emissions_file_out_name = "building-benchmarks"
 
@@ -81,35 +82,48 @@ def hasReportedData(ghg_intensity) -> bool:
     )
 
 
+def hasReportedDataMask(ghg_intensity: pandas.Series) -> pandas.Series:
+    """
+    Vectorized hasReportedData, returning whether each GHG Intensity in a column is reported data.
+
+    Numeric columns are checked all at once, while other columns (e.g. a mix of numbers and strings)
+    fall back to checking each value with hasReportedData, so strings still never count.
+    """
+    if pandas.api.types.is_numeric_dtype(ghg_intensity):
+        return (ghg_intensity > 0).fillna(False).astype(bool)
+
+    return ghg_intensity.map(hasReportedData).astype(bool)
+
+
 def calculateFirstAndLastYearReported(
     building_data: pandas.DataFrame,
-) -> Dict[str, Dict[str, int]]:
+) -> pandas.DataFrame:
     """
     Calculate FirstYearReported and LastYearReported for each building ID.
 
-    Returns a dictionary mapping building ID to dict with FirstYearReported and LastYearReported.
+    Returns a DataFrame indexed by building ID (as a string), with FirstYearReported and
+    LastYearReported columns. Buildings with no valid reported data aren't included.
     """
-    reporting_years = {}
-
-    # Group by ID and process each building
-    for building_id, building_group in building_data.groupby("ID"):
-        # Filter to rows with valid reported data
-        reported_data = building_group[
-            building_group["GHGIntensity"].apply(hasReportedData)
-        ]
-
-        if len(reported_data) > 0:
-            years = sorted(reported_data["DataYear"].tolist())
-            reporting_years[str(building_id)] = {
-                "FirstYearReported": years[0],
-                "LastYearReported": years[-1],
-            }
-        # If no valid data, we don't include this building in the output
+    # Each building's years with valid reported data, as a (building x year) panel
+    panel = get_building_panel(building_data)
+    reported_data_by_year = panel.get_column(
+        "HasReportedData",
+        lambda: hasReportedDataMask(building_data.loc[:, "GHGIntensity"]),
+    )
+    has_reported_data = reported_data_by_year == 1
+
+    reporting_years = pandas.DataFrame(
+        {
+            "FirstYearReported": panel.first_years(has_reported_data),
+            "LastYearReported": panel.last_years(has_reported_data),
+        },
+        index=panel.building_ids.astype(str),
+    ).loc[has_reported_data.any(axis=1)]
 
     if debug:
         print(f"Calculated reporting years for {len(reporting_years)} buildings")
         # Show some examples
-        for bid, years in list(reporting_years.items())[:5]:
+        for bid, years in reporting_years.head(5).iterrows():
             print(
                 f"  Building {bid}: {years['FirstYearReported']} - {years['LastYearReported']}"
             )
@@ -117,62 +131,87 @@ def calculateFirstAndLastYearReported(
     return reporting_years
 
 
-# Calculates year-over-year stats for all buildings and outputs them into a keyed JSON file
-def calculateBuildingStatsByYear(building_data_in: pandas.DataFrame) -> List[str]:
-    """
-    Calculates year-over-year stats for all buildings and outputs them into a keyed JSON file.
-    Returns statistics for each year in the dataset.
+# The first year of data we have stats for
+HISTORIC_DATA_START_YEAR = 2016
 
-    Returns an array of files written to
+# The describe() stats we keep, in the order we output them. Note that 50% = median
+detail_cols_to_keep = ["count", "mean", "std", "min", "max", "25%", "50%", "75%"]
+
+# Rename stats to work with GraphQL (no numbers like '25%')
+detail_col_names = {
+    "25%": "twentyFifthPercentile",
+    "50%": "median",
+    "75%": "seventyFifthPercentile",
+}
+
+
+def describe_groups(
+    building_data: pandas.DataFrame, group_cols: List[str]
+) -> Iterator[Tuple[Any, dict]]:
     """
+    Describes the building_cols_to_analyze for each group of rows from HISTORIC_DATA_START_YEAR on
+    (e.g. each year), in one groupby instead of filtering the data for each group.
 
-    # Clone the input data to prevent manipulating it on accident
-    building_data = building_data_in.copy()
+    Yields each group's key (a tuple if grouping by multiple columns) in sorted order, with its
+    stats for each column, rounded to 1 decimal place and cleaned up with clean_year_stats. Groups
+    without any rows aren't included.
+    """
+    recent_data = building_data.loc[
+        building_data["DataYear"] >= HISTORIC_DATA_START_YEAR,
+        group_cols + building_cols_to_analyze,
+    ]
+
+    if recent_data.empty:
+        return
+
+    # One row per group, with a (column, stat) pair for each column
+    stats_by_group = (
+        recent_data.groupby(group_cols, observed=True)[building_cols_to_analyze]
+        .describe()
+        .round(1)
+    )
 
-    # The details columns we want to keep. Note that 50% = median
-    detail_cols_to_keep = ["count", "mean", "std", "min", "max", "25%", "50%", "75%"]
+    # describe() leaves out columns that aren't numeric (e.g. all empty), so keep the columns we
+    # got stats for, in their usual order
+    described_cols = [
+        col
+        for col in building_cols_to_analyze
+        if col in stats_by_group.columns.get_level_values(0)
+    ]
+
+    for group_key, group_stats in stats_by_group.iterrows():
+        # Back to a describe() result for just this group, with the stats in our order
+        group_stats_df = (
+            group_stats.unstack(level=0)
+            .loc[detail_cols_to_keep, described_cols]
+            .rename(index=detail_col_names)
+        )
 
-    # Get all unique years in the dataset
-    years = sorted(building_data["DataYear"].unique())
+        yield group_key, clean_year_stats(group_stats_df.to_dict())
 
-    # Dictionary to store results for each year
-    yearly_stats = {}
-    HISTORIC_DATA_START_YEAR = 2016
 
-    for year in years:
-        if year < HISTORIC_DATA_START_YEAR:
-            continue
+def describe_by_year(building_data: pandas.DataFrame) -> dict:
+    """
+    Describes the building_cols_to_analyze for each year from HISTORIC_DATA_START_YEAR on.
 
-        # Filter data for this specific year
-        year_data = building_data[building_data["DataYear"] == year]
+    Returns a dict of each year (as a string) to its stats for each column (see describe_groups)
+    """
+    return {
+        str(year): year_stats
+        for year, year_stats in describe_groups(building_data, ["DataYear"])
+    }
 
-        # Calculate statistics for this year
-        year_stats_df = (
-            year_data[building_cols_to_analyze].describe().loc[detail_cols_to_keep]  # type: ignore
-        )
 
-        # Round all data to 1 decimal place
-        year_stats_df = year_stats_df.round(1)
-
-        if debug:
-            print("-" * 60)
-            print(year)
-            print(year_stats_df)
-
-        # Rename columns to work with GraphQL (no numbers like '25%')
-        year_stats_df.rename(
-            index={
-                "25%": "twentyFifthPercentile",
-                "50%": "median",
-                "75%": "seventyFifthPercentile",
-            },
-            inplace=True,
-        )
+# Calculates year-over-year stats for all buildings and outputs them into a keyed JSON file
+def calculateBuildingStatsByYear(building_data: pandas.DataFrame) -> List[str]:
+    """
+    Calculates year-over-year stats for all buildings and outputs them into a keyed JSON file.
+    Returns statistics for each year in the dataset.
 
-        # Convert to dictionary and store
-        yearly_stats[str(year)] = clean_year_stats(year_stats_df.to_dict())
+    Returns an array of files written to
+    """
 
-    # Create summary statistics across all years
+    yearly_stats = describe_by_year(building_data)
 
     if debug:
         print(f"\n{'=' * 50}")
@@ -183,17 +222,12 @@ def calculateBuildingStatsByYear(building_data_in: pandas.DataFrame) -> List[str
         )
         print("-" * 60)
 
-    for year in years:
-        if year < HISTORIC_DATA_START_YEAR:
-            continue
+        for year, year_stats in yearly_stats.items():
+            buildings = year_stats["TotalGHGEmissions"]["count"]
+            avg_ghg = year_stats["TotalGHGEmissions"].get("mean", float("nan"))
+            median_ghg = year_stats["TotalGHGEmissions"].get("median", float("nan"))
+            avg_intensity = year_stats["GHGIntensity"].get("mean", float("nan"))
 
-        year_stats = yearly_stats[str(year)]
-        buildings = int(year_stats["TotalGHGEmissions"]["count"])
-        avg_ghg = year_stats["TotalGHGEmissions"]["mean"]
-        median_ghg = year_stats["TotalGHGEmissions"]["median"]
-        avg_intensity = year_stats["GHGIntensity"]["mean"]
-
-        if debug:
             print(
                 f"{year:<6} {buildings:<10} {avg_ghg:<12.1f} {median_ghg:<12.1f} {avg_intensity:<12.1f}"
             )
@@ -211,18 +245,13 @@ def calculateBuildingStatsByYear(building_data_in: pandas.DataFrame) -> List[str
     return [stats_dist_output_path, stats_debug_output_path]
 
 
-def main():
-    # Read in the buildings data CSV from the previous pipeline step
-    building_data = get_and_clean_csv(
-        get_data_file_path(data_out_directory, building_emissions_file)
-    )
-
-    # Convert our columns to analyze to numeric data by stripping commas, otherwise the rankings are junk
-    building_data[building_cols_to_analyze] = building_data[
-        building_cols_to_analyze
-    ].apply(
-        lambda x: pandas.to_numeric(x.astype(str).str.replace(",", ""), errors="coerce")
-    )
+def main(context: PipelineContext | None = None):
+    # Read in the buildings data from the previous pipeline step, whose columns to analyze are
+    # already numeric (see benchmarking_schema)
+    if context is not None:
+        building_data = context.get(HISTORIC_DATA)
+    else:
+        building_data = load_pipeline_frame(HISTORIC_DATA)
 
     # Calculate statistics by year for all buildings
     stats_files = calculateBuildingStatsByYear(building_data)
@@ -8,26 +8,22 @@ over time.
 """
 
 import pandas
-from typing import cast
 from src.data.scripts.utils import (
-    get_and_clean_csv,
     get_data_file_path,
     log_step_completion,
     write_json_with_newline,
 )
-from src.data.scripts.generate_historic_stats import (
-    building_cols_to_analyze,
-    clean_year_stats,
+from src.data.scripts.generate_historic_stats import describe_groups
+from src.data.scripts.pipeline_context import (
+    PipelineContext,
+    BUILDING_BENCHMARKS,
+    HISTORIC_DATA,
+    load_pipeline_frame,
 )
 
 output_filename = "historic-stats-by-property-type.json"
 data_out_directory = "dist"
 data_debug_directory = "debug"
-building_emissions_file = "benchmarking-all-years.csv"
-# PrimaryPropertyType lives here; we join it onto the all-years data by ID
-building_benchmarks_file = "building-benchmarks.csv"
-
-HISTORIC_DATA_START_YEAR = 2016
 
 
 def calculate_historic_stats_by_property_type(
@@ -41,43 +37,13 @@ def calculate_historic_stats_by_property_type(
 
     Returns a list of file paths written.
     """
-    detail_cols_to_keep = ["count", "mean", "std", "min", "max", "25%", "50%", "75%"]
-    rename_map = {
-        "25%": "twentyFifthPercentile",
-        "50%": "median",
-        "75%": "seventyFifthPercentile",
-    }
-
-    years = sorted(building_data["DataYear"].unique())
-    property_types = sorted(building_data["PrimaryPropertyType"].dropna().unique())
-
     stats_by_property_type = {}
 
-    for property_type in property_types:
-        prop_data = building_data[building_data["PrimaryPropertyType"] == property_type]
-        yearly_stats = {}
-
-        for year in years:
-            if year < HISTORIC_DATA_START_YEAR:
-                continue
-
-            year_data = cast(pandas.DataFrame, prop_data[prop_data["DataYear"] == year])
-
-            if year_data.empty:
-                continue
-
-            year_stats_df = (
-                year_data[building_cols_to_analyze]
-                .describe()
-                .loc[detail_cols_to_keep]
-                .round(1)
-                .rename(index=rename_map)
-            )
-
-            yearly_stats[str(year)] = clean_year_stats(year_stats_df.to_dict())
-
-        if yearly_stats:
-            stats_by_property_type[property_type] = yearly_stats
+    # Describe every property type's years in one pass over the data
+    for (property_type, year), year_stats in describe_groups(
+        building_data, ["PrimaryPropertyType", "DataYear"]
+    ):
+        stats_by_property_type.setdefault(property_type, {})[str(year)] = year_stats
 
     dist_path = get_data_file_path(data_out_directory, output_filename)
     debug_path = get_data_file_path(data_debug_directory, output_filename)
@@ -91,24 +57,21 @@ def calculate_historic_stats_by_property_type(
 ###
 ### Main
 ###
-def main() -> None:
-    building_data = get_and_clean_csv(
-        get_data_file_path(data_out_directory, building_emissions_file)
-    )
-
-    # Convert columns to numeric, stripping commas from formatted numbers
-    building_data[building_cols_to_analyze] = building_data[
-        building_cols_to_analyze
-    ].apply(
-        lambda x: pandas.to_numeric(x.astype(str).str.replace(",", ""), errors="coerce")
-    )
+def main(context: PipelineContext | None = None) -> None:
+    # The historic data's columns to analyze are already numeric (see benchmarking_schema)
+    if context is not None:
+        building_data = context.get(HISTORIC_DATA)
+    else:
+        building_data = load_pipeline_frame(HISTORIC_DATA)
 
     # PrimaryPropertyType is only in building-benchmarks.csv (latest year per building).
     # Join it onto the all-years data by ID so we can group historic data by property type.
-    benchmarks = pandas.read_csv(
-        get_data_file_path(data_out_directory, building_benchmarks_file),
-        usecols=pandas.Index(["ID", "PrimaryPropertyType"]),
-    )
+    if context is not None:
+        benchmarks = context.get(BUILDING_BENCHMARKS)[["ID", "PrimaryPropertyType"]]
+    else:
+        benchmarks = load_pipeline_frame(BUILDING_BENCHMARKS)[
+            ["ID", "PrimaryPropertyType"]
+        ]
     building_data = building_data.merge(benchmarks, on="ID", how="left")
 
     output_files = calculate_historic_stats_by_property_type(building_data)
@@ -10,19 +10,17 @@ from pandas.core.groupby.generic import DataFrameGroupBy
 from src.data.scripts.utils import (
     get_data_file_path,
     log_step_completion,
-    output_to_csv,
     write_json_with_newline,
 )
-from src.data.scripts.building_utils import (
-    benchmarking_string_cols,
-    benchmarking_int_cols,
+from src.data.scripts.pipeline_context import (
+    PipelineContext,
+    BUILDING_BENCHMARKS,
+    load_pipeline_frame,
+    save_pipeline_frame,
 )
 
 out_dir = "dist"
 
-# Input file path (also written to)
-input_benchmark_data_csv_path = get_data_file_path(out_dir, "building-benchmarks.csv")
-
 # Output file paths
 property_types_file_path = get_data_file_path(out_dir, "property-types.json")
 property_stats_file_path = get_data_file_path(
@@ -83,10 +81,14 @@ def calculate_building_stats(
     # Compute all stats upfront
     describe_df = grouped_by_prop_type[building_cols_to_rank].describe()
     sum_df = grouped_by_prop_type[building_cols_to_total].sum()
+
+    # Drop zero counts and sort grades alphabetically, since categorical letter grades (as they come
+    # out of grading) count every grade in the order of their categories
+    grade_counts = grouped_by_prop_type["AvgPercentileLetterGrade"].value_counts()
     grade_dist = (
-        grouped_by_prop_type["AvgPercentileLetterGrade"]
-        .value_counts()
+        grade_counts.loc[grade_counts > 0]
         .unstack(fill_value=0)
+        .sort_index(axis=1, key=lambda grades: grades.astype(str))
     )
 
     stats_by_property_type = {}
@@ -132,42 +134,37 @@ def calculate_building_stats(
 def rank_buildings_by_property_type(
     building_data: pd.DataFrame,
     grouped_by_prop_type: DataFrameGroupBy,
+    context: PipelineContext | None = None,
 ) -> List[str]:
     """
     Ranks buildings against others of the same property type using only the latest year's
-    buildings, then re-exports the file.
+    buildings, then re-exports the file (or passes it on in the pipeline context, if given).
 
     Returns the file paths written to
     """
 
-    # Mark columns that look like numbers but should be strings as such to prevent decimals showing
-    # up (e.g. zipcode of 60614 or Ward 9) and make sure missing data is output as a string
-    building_data[benchmarking_string_cols] = (
-        building_data[benchmarking_string_cols].fillna("").astype(str)
-    )
-
-    # Mark columns as ints that should never show a decimal, e.g. Number of Buildings, Zipcode
-    building_data[benchmarking_int_cols] = building_data[benchmarking_int_cols].astype(
-        "Int64"
-    )
-
     # use pandas to rank each value for each property and store as category+"RankByProperty"
     for col in building_cols_to_rank:
         building_data[col + "RankByPropertyType"] = grouped_by_prop_type[col].rank(
             ascending=False
         )
 
-    output_to_csv(building_data, input_benchmark_data_csv_path)
+    if context is not None:
+        context.set(BUILDING_BENCHMARKS, building_data)
+        return []
 
-    return [input_benchmark_data_csv_path]
+    return [save_pipeline_frame(BUILDING_BENCHMARKS, building_data)]
 
 
 ###
 ### Main
 ###
-def main() -> None:
+def main(context: PipelineContext | None = None) -> None:
     # Read in benchmark data, which only contains one instance of each building
-    building_data = pd.read_csv(input_benchmark_data_csv_path)
+    if context is not None:
+        building_data = context.get(BUILDING_BENCHMARKS)
+    else:
+        building_data = load_pipeline_frame(BUILDING_BENCHMARKS)
 
     # find the latest year
     latest_year = building_data["DataYear"].max()
@@ -192,7 +189,7 @@ def main() -> None:
         calculate_building_stats(all_property_types, all_buildings_grouped)
     ]
     outputted_paths += rank_buildings_by_property_type(
-        building_data, latest_year_grouped
+        building_data, latest_year_grouped, context
     )
     outputted_paths += generate_property_types(latest_property_types)
 
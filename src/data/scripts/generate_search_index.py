@@ -24,12 +24,14 @@ from src.data.scripts.utils import (
     log_step_completion,
     output_to_csv,
 )
+from src.data.scripts.pipeline_context import (
+    PipelineContext,
+    BUILDING_BENCHMARKS,
+    load_pipeline_frame,
+)
 
 out_dir = "dist"
 
-# Input file path - the main file with one row per building
-input_benchmark_data_csv_path = get_data_file_path(out_dir, "building-benchmarks.csv")
-
 # Output file path
 search_index_file_path = get_data_file_path(out_dir, "building-search-index.csv")
 
@@ -77,8 +79,11 @@ def generate_search_index(building_data: pd.DataFrame) -> List[str]:
 ###
 ### Main
 ###
-def main() -> None:
-    building_data = pd.read_csv(input_benchmark_data_csv_path)
+def main(context: PipelineContext | None = None) -> None:
+    if context is not None:
+        building_data = context.get(BUILDING_BENCHMARKS)
+    else:
+        building_data = load_pipeline_frame(BUILDING_BENCHMARKS)
 
     outputted_paths = generate_search_index(building_data)
 
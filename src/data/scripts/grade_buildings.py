@@ -8,12 +8,12 @@ all there's nothing to evaluate, and a fabricated grade (e.g. a 0% energy mix or
 consistency) would be misleading rather than informative.
 """
 
+import numpy as np
 import pandas as pd
-from scipy.stats import percentileofscore
-from typing import List
+from typing import List, cast
 
 from src.data.scripts.utils import get_data_file_path
-from src.data.scripts.generate_historic_stats import hasReportedData
+from src.data.scripts.generate_historic_stats import hasReportedDataMask
 
 
 data_directory = "dist"
@@ -53,6 +53,15 @@ grade_cols = [
     "AvgPercentileLetterGrade",
 ]
 
+# The energy use columns that make up a building's energy mix
+energy_source_cols = [
+    "ElectricityUse",
+    "NaturalGasUse",
+    "DistrictSteamUse",
+    "DistrictChilledWaterUse",
+    "AllOtherFuelUse",
+]
+
 # Default weights for each energy source in the energy mix grade, from 0 - 1, where 1 is totally
 # clean and 0 is totally dirty. E.g. a 50% gas building gets a C energy mix raw score, 100%
 # electric gets an A, but then we weight against overall building stock, so you get a B if you have
@@ -72,18 +81,40 @@ energy_mix_grade_weights = {
 }
 
 
+def calculate_weak_percentiles(vals: pd.Series) -> pd.Series:
+    """Get the percentage of (non-NaN) values in `vals` that each value is greater than or equal
+    to, the same as calling `percentileofscore(vals, x, kind="weak", nan_policy="omit")` for each
+    value, but with one sort instead of rescanning every value for each building.
+
+    NaN values get a NaN percentile, as do all values if there are no non-NaN values to compare to.
+    """
+    values = vals.to_numpy(dtype=float, na_value=np.nan)
+    sorted_values = np.sort(values[~np.isnan(values)])
+
+    if len(sorted_values) == 0:
+        return pd.Series(np.nan, index=vals.index)
+
+    # For each value, the count of values less than or equal to it, using the same formula as
+    # percentileofscore so we get the exact same floats
+    counts_at_or_below = np.searchsorted(sorted_values, values, side="right")
+    percentiles = counts_at_or_below * (100.0 / len(sorted_values))
+
+    return pd.Series(np.where(np.isnan(values), np.nan, percentiles), index=vals.index)
+
+
 def generate_percentile_grade(
     vals: pd.Series,
     col_base_name: str,
     reverse: bool = False,
     bins: List[int] = bins,
     letter_grades: List[str] = letter_grades,
+    groups: pd.Series | None = None,
 ) -> pd.DataFrame:
     """For each building record from `vals`, translate numerical
     values into a percentile grade and it's letter grade
     equivalent. E.g. percentile
     grade of 56.37 means this building is better than 56.37% of records in
-    `vals`.
+    `vals` (or of the records in the same group, if `groups` is given).
 
     NOTE: Handles NaN values by omitting them, so it doesn't error due to buildings missing
     some data.
@@ -99,6 +130,9 @@ def generate_percentile_grade(
         Integers denoting boundaries between letter grades.
     letter_grades : List[str]
         Letter grades corresponding to the bins.
+    groups : pd.Series, optional
+        Values to group records by, aligned to `vals` (e.g. DataYear), so each record is
+        only compared to the records in its group. If None, all records are compared.
 
     Returns
     -------
@@ -110,16 +144,15 @@ def generate_percentile_grade(
     grades = pd.DataFrame(index=vals.index)
 
     # Calculate percentile-based score out 100, ignoring NaN values
-    if reverse:
-
-        def calc_func(x):
-            return 100 - percentileofscore(vals, x, kind="weak", nan_policy="omit")
+    if groups is None:
+        percent_scores = calculate_weak_percentiles(vals)
     else:
+        percent_scores = cast(
+            pd.Series, vals.groupby(groups).transform(calculate_weak_percentiles)
+        )
 
-        def calc_func(x):
-            return percentileofscore(vals, x, kind="weak", nan_policy="omit")
-
-    percent_scores: pd.Series = vals.apply(calc_func)  # type: ignore
+    if reverse:
+        percent_scores = 100 - percent_scores
     grades[f"{col_base_name}PercentileGrade"] = percent_scores
 
     # Calculate letter grades (right threshold is included):
@@ -164,15 +197,10 @@ def generate_energy_int_grade(
         index. `cols_to_keep` are also included.
 
     """
-    relevant_cols: pd.DataFrame = df.loc[
-        df["DataYear"] == year,
-        cols_to_keep,
-    ]
+    in_year = df["DataYear"] == year
 
-    ghg_intensity: pd.Series = df.loc[
-        df["DataYear"] == year,
-        "GHGIntensity",
-    ]
+    relevant_cols: pd.DataFrame = df.loc[in_year, cols_to_keep]
+    ghg_intensity: pd.Series = df.loc[in_year, "GHGIntensity"]
 
     ghg_intensity_grades_df: pd.DataFrame = generate_percentile_grade(
         vals=ghg_intensity,
@@ -196,6 +224,9 @@ def apply_grade_func_all_years(df, func):
     """Generate grades for all years in the `df` dataset using a given `func`
     to grade each year.
 
+    NOTE: Grades each year separately, handy for looking at one grade at a time. The pipeline uses
+    grade_ghg_intensity_energy_mix_all_years, which grades every year in one pass.
+
     Parameters
     ----------
     df : pd.DataFrame
@@ -221,6 +252,47 @@ def apply_grade_func_all_years(df, func):
     return grades_all_years_df
 
 
+def calculate_energy_mix_weighted_pct_sum(
+    df: pd.DataFrame,
+    energy_mix_grade_weights: dict = energy_mix_grade_weights,
+) -> pd.Series:
+    """Calculate the weighted sum of each building record's energy use percentages by source, the
+    raw score we grade energy mix on (e.g. 100 for all electric, 0 for all gas).
+
+    Records with no energy use data at all come back NaN rather than 0.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Dataframe containing building records.
+    energy_mix_grade_weights : dict, optional
+        Weights to use, by default energy_mix_grade_weights
+
+    Returns
+    -------
+    weighted_pct_scores : pd.Series
+        The weighted energy use percentage sum for each record, named "EnergyMixWeightedPctSum".
+        Uses `df`'s index.
+
+    """
+    energy_use_df: pd.DataFrame = df.loc[:, energy_source_cols]
+
+    # min_count=1 so a building with no energy data at all (e.g. one that never submitted)
+    # sums to NaN instead of 0, so it doesn't get graded as if it had a real 0% mix
+    total_energy_use_per_bldg: pd.Series = energy_use_df.sum(1, min_count=1)
+
+    # Energy use kBtu percentage within each building:
+    energy_use_pct_df = energy_use_df.div(total_energy_use_per_bldg, axis="index") * 100
+
+    # Calculate weighted energy mix grade:
+    weighted_pct_scores: pd.Series = energy_use_pct_df.mul(
+        energy_mix_grade_weights
+    ).sum(1, min_count=1)
+    weighted_pct_scores.name = "EnergyMixWeightedPctSum"
+
+    return weighted_pct_scores
+
+
 def generate_energymix_grade(
     df: pd.DataFrame,
     year: int,
@@ -262,35 +334,13 @@ def generate_energymix_grade(
         `cols_to_keep` are also included.
 
     """
-    relevant_cols: pd.DataFrame = df.loc[
-        df["DataYear"] == year,
-        cols_to_keep,
-    ]
-
-    energy_source_cols = [
-        "ElectricityUse",
-        "NaturalGasUse",
-        "DistrictSteamUse",
-        "DistrictChilledWaterUse",
-        "AllOtherFuelUse",
-    ]
-    energy_use_df: pd.DataFrame = df.loc[
-        df["DataYear"] == year,
-        energy_source_cols,
-    ]
-
-    # min_count=1 so a building with no energy data at all (e.g. one that never submitted)
-    # sums to NaN instead of 0, so it doesn't get graded as if it had a real 0% mix
-    total_energy_use_per_bldg: pd.Series = energy_use_df.sum(1, min_count=1)
+    year_df: pd.DataFrame = df.loc[df["DataYear"] == year]
 
-    # Energy use kBtu percentage within each building for this year:
-    energy_use_pct_df = energy_use_df.div(total_energy_use_per_bldg, axis="index") * 100
+    relevant_cols: pd.DataFrame = year_df.loc[:, cols_to_keep]
 
-    # Calculate weighted energy mix grade:
-    weighted_pct_scores: pd.Series = energy_use_pct_df.mul(
-        energy_mix_grade_weights
-    ).sum(1, min_count=1)
-    weighted_pct_scores.name = "EnergyMixWeightedPctSum"
+    weighted_pct_scores = calculate_energy_mix_weighted_pct_sum(
+        year_df, energy_mix_grade_weights
+    )
 
     # Generate percentile and letter grades:
     energy_mix_grades: pd.DataFrame = generate_percentile_grade(
@@ -325,37 +375,32 @@ def calculate_building_submission_rate(df: pd.DataFrame) -> pd.DataFrame:
     Calculates the submission rate per building (percentage of years submitted).
 
     Args:
-        df (pd.DataFrame): The DataFrame with building and year data.
-        building_id_col (str): The name of the building ID column.
-        status_col (str): The name of the status column.
-        not_submitted_val (str): The value indicating a building is not submitted.
+        df (pd.DataFrame): The DataFrame with building and year data, with ID and GHGIntensity
+            columns.
 
     Returns:
-        pd.DataFrame: A DataFrame with building IDs and their submission rates as a SubmissionRate
-            column
+        pd.DataFrame: A DataFrame with building IDs and their submission rates as a
+            submission_rate column, plus the number of years they didn't submit as a
+            not_submitted_count column
     """
 
-    def calculate_metrics(group):
-        total_years = len(group)
-        # A year only counts as "submitted" if it has real GHG Intensity data - matches
-        # FirstYearReported/LastYearReported, since a ReportingStatus of e.g. "Exempt" isn't a
-        # real submission even though it's not literally "Not Submitted"
-        submitted_years = group["GHGIntensity"].apply(hasReportedData).sum()
-        not_submitted_count = total_years - submitted_years
-
-        if total_years == 0:
-            submission_rate = 0.0
-        else:
-            submission_rate = (submitted_years / total_years) * 100
-
-        return pd.Series(
-            {
-                "submission_rate": submission_rate,
-                "not_submitted_count": not_submitted_count,
-            }
-        )
+    # A year only counts as "submitted" if it has real GHG Intensity data - matches
+    # FirstYearReported/LastYearReported, since a ReportingStatus of e.g. "Exempt" isn't a
+    # real submission even though it's not literally "Not Submitted"
+    has_reported = hasReportedDataMask(df.loc[:, "GHGIntensity"])
+
+    # Counted by row, so a building with two records for a year counts both
+    year_counts = has_reported.groupby(df["ID"]).agg(["size", "sum"])
+    total_years = year_counts["size"]
+    submitted_years = year_counts["sum"]
 
-    submission_rates = df.groupby("ID").apply(calculate_metrics).reset_index()
+    submission_rates = pd.DataFrame(
+        {
+            "submission_rate": (submitted_years / total_years) * 100,
+            # A float, as it's always been written out to the all years CSV (e.g. 2.0)
+            "not_submitted_count": (total_years - submitted_years).astype(float),
+        }
+    ).reset_index()
 
     return submission_rates
 
@@ -429,7 +474,8 @@ def generate_consistent_reporting_grade(
 
 def grade_ghg_intensity_energy_mix_all_years(building_data: pd.DataFrame):
     """Generate grades for all years in the dataset based on GHG intensity and
-    energy mix.
+    energy mix. Each record is graded against the other records from the same year, with the
+    percentiles for every year calculated in one grouped pass.
 
     Parameters
     ----------
@@ -440,33 +486,32 @@ def grade_ghg_intensity_energy_mix_all_years(building_data: pd.DataFrame):
     -------
     df : pd.DataFrame
         Grades for all years in the dataset based on GHG intensity and energy
-        mix, merged with the original dataset.
+        mix, added to the original dataset (keeping its index).
 
     """
-    # Generate grades for GHG intensity:
-    ghg_intensity_grades_all_years = apply_grade_func_all_years(
-        df=building_data,
-        func=generate_energy_int_grade,
-    )
+    years: pd.Series = building_data.loc[:, "DataYear"]
 
-    # Generate grades for energy mix:
-    energy_mix_grades_all_years = apply_grade_func_all_years(
-        df=building_data,
-        func=generate_energymix_grade,
+    # Generate grades for GHG intensity (lower is better):
+    ghg_intensity_grades = generate_percentile_grade(
+        vals=building_data.loc[:, "GHGIntensity"],
+        col_base_name="GHGIntensity",
+        reverse=True,
+        groups=years,
     )
 
-    # Merge grades:
-    grades_all_years_df = pd.merge(
-        ghg_intensity_grades_all_years,
-        energy_mix_grades_all_years,
-        on=["ID", "DataYear"],
+    # Generate grades for energy mix, keeping the weighted percent scores for reference:
+    weighted_pct_scores = calculate_energy_mix_weighted_pct_sum(building_data)
+    energy_mix_grades = generate_percentile_grade(
+        vals=weighted_pct_scores,
+        col_base_name="EnergyMix",
+        reverse=False,
+        groups=years,
     )
 
     # Add to the original dataset:
-    df = pd.merge(
-        building_data,
-        grades_all_years_df,
-        on=["ID", "DataYear"],
+    df = pd.concat(
+        [building_data, ghg_intensity_grades, weighted_pct_scores, energy_mix_grades],
+        axis=1,
     )
 
     return df
@@ -495,16 +540,20 @@ def calculate_weighted_average(graded_df: pd.DataFrame) -> pd.Series:
     return weighted_average
 
 
-def grade_buildings():
+def grade_buildings(df_historical: pd.DataFrame | None = None):
     """
     Generate all grade_cols for every building/year in the historical data - GHG intensity, energy
     mix, and reporting consistency percentile/letter grades, plus the overall weighted average.
 
+    Grades the passed in historical data if given (e.g. held in memory by run_all.py), otherwise
+    reads the all years CSV from the previous step.
+
     Buildings that never submitted any data get NaN/blank for every grade column (see
     generate_energymix_grade and generate_consistent_reporting_grade), since we have nothing to
     grade them on.
     """
-    df_historical = pd.read_csv(data_in_file_historical_path)
+    if df_historical is None:
+        df_historical = pd.read_csv(data_in_file_historical_path)
 
     # Generate grades for all years for GHG Intensity and Energy Mix:
     graded_df = grade_ghg_intensity_energy_mix_all_years(
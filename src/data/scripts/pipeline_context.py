@@ -0,0 +1,194 @@
+"""
+Pipeline Context - Holds the data frames that get passed between steps of the data pipeline
+
+When a step is run on its own (`uv run python -m src.data.scripts.<step>`) it reads the CSV the
+previous step wrote and writes its own CSV back out. When run_all.py runs the whole pipeline in one
+process, it instead passes a single PipelineContext to every step, so each step picks up and updates
+the frames in memory, and the CSVs are only written once at the end with write_outputs().
+
+Alongside each CSV we keep a typed copy of the frame (a pickle in the debug folder), which keeps the
+dtypes the step gave it (nullable ints, strings), so the next step loads it as is instead of
+reparsing the CSV and coercing its columns again. We also keep the hash of the CSV the typed copy was
+saved with, so we only use it while the CSV still has the same contents.
+"""
+
+import os
+import pandas as pd
+
+from typing import Dict, List, cast
+
+from src.data.scripts.utils import (
+    get_and_clean_csv,
+    get_data_file_path,
+    get_memory_usage_mb,
+    hash_file,
+    output_to_csv,
+)
+from src.data.scripts.building_utils import (
+    benchmarking_string_cols,
+    benchmarking_int_cols,
+)
+
+# The names of the frames shared between steps
+NEWEST_DATA = "newest_data"
+BUILDING_BENCHMARKS = "building_benchmarks"
+HISTORIC_DATA = "historic_data"
+
+# The (directory, filename) each shared frame is loaded from and written to
+pipeline_files = {
+    # The latest submission for each building from step 1, before any ranking or grading
+    NEWEST_DATA: ("debug", "benchmarking-all-newest-temp.csv"),
+    # One row per building (the latest year they reported), our main file for the site
+    BUILDING_BENCHMARKS: ("dist", "building-benchmarks.csv"),
+    # One row per building per year, with the columns we track over time
+    HISTORIC_DATA: ("dist", "benchmarking-all-years.csv"),
+}
+
+
+# Where we keep the typed copy of each shared frame
+pipeline_frames_directory = get_data_file_path("debug", "pipeline-frames")
+
+# The types we store each frame's columns as that a CSV loses, which we restore if we have to load
+# the frame from its CSV
+pipeline_frame_dtypes: Dict[str, Dict[str, str]] = {
+    # Set by process_data (e.g. so a Zipcode of 60614 doesn't become 60614.0)
+    BUILDING_BENCHMARKS: {
+        **{col: "string" for col in benchmarking_string_cols},
+        **{col: "Int64" for col in benchmarking_int_cols},
+    },
+    # Most steps hold the historic data at once, often in parallel, so we keep it compact with its
+    # few-valued columns as categories and its IDs and years as small ints (see compact_frame)
+    HISTORIC_DATA: {
+        "ID": "int32",
+        "DataYear": "int16",
+        "ReportingStatus": "category",
+        "ChicagoEnergyRating": "category",
+    },
+}
+
+
+def get_pipeline_file_path(name: str) -> str:
+    """Get the path of the CSV a shared frame is written to"""
+    directory, filename = pipeline_files[name]
+
+    return get_data_file_path(directory, filename)
+
+
+def get_pipeline_frame_path(name: str) -> str:
+    """Get the path of the typed copy of a shared frame"""
+    return os.path.join(pipeline_frames_directory, f"{name}.pkl")
+
+
+def get_pipeline_frame_hash_path(name: str) -> str:
+    """Get the path of the hash of the CSV a shared frame's typed copy was saved with"""
+    return os.path.join(pipeline_frames_directory, f"{name}.csv.sha256")
+
+
+def get_saved_csv_hash(name: str) -> str | None:
+    """Get the hash of the CSV a shared frame's typed copy was saved with, if we have it"""
+    hash_path = get_pipeline_frame_hash_path(name)
+
+    if not os.path.exists(hash_path):
+        return None
+
+    with open(hash_path, "r", encoding="utf-8") as f:
+        return f.read().strip()
+
+
+def set_frame_dtypes(name: str, data: pd.DataFrame) -> pd.DataFrame:
+    """Give a frame's columns the types we store them as, for the columns it has"""
+    dtypes = pipeline_frame_dtypes.get(name, {})
+    frame_dtypes = {col: dtypes[col] for col in data.columns if col in dtypes}
+
+    # Avoid copying frames with no columns to convert
+    if not frame_dtypes:
+        return data
+
+    return data.astype(frame_dtypes)
+
+
+def compact_frame(name: str, data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Store a frame's columns as their compact types before handing it on to the next steps, printing
+    how much memory that saves
+    """
+    memory_before = get_memory_usage_mb(data)
+    data = set_frame_dtypes(name, data)
+
+    print(
+        f"Memory for {name}: {memory_before:.1f} MB -> {get_memory_usage_mb(data):.1f} MB"
+    )
+
+    return data
+
+
+def load_pipeline_frame(name: str) -> pd.DataFrame:
+    """
+    Load a shared frame from its typed copy, or from its CSV if we don't have a typed copy or the
+    CSV has changed since it was saved (e.g. a different CSV was checked out or copied in)
+    """
+    csv_path = get_pipeline_file_path(name)
+    frame_path = get_pipeline_frame_path(name)
+
+    if os.path.exists(frame_path) and (
+        not os.path.exists(csv_path) or get_saved_csv_hash(name) == hash_file(csv_path)
+    ):
+        return cast(pd.DataFrame, pd.read_pickle(frame_path))
+
+    return set_frame_dtypes(name, get_and_clean_csv(csv_path))
+
+
+def save_pipeline_frame(name: str, data: pd.DataFrame) -> str:
+    """
+    Write a shared frame to its CSV and then its typed copy, along with the CSV's hash, returning the
+    CSV's path
+    """
+    csv_path = get_pipeline_file_path(name)
+    output_to_csv(data, csv_path)
+
+    os.makedirs(pipeline_frames_directory, exist_ok=True)
+    data.to_pickle(get_pipeline_frame_path(name))
+
+    with open(get_pipeline_frame_hash_path(name), "w", encoding="utf-8") as f:
+        f.write(hash_file(csv_path) + "\n")
+
+    return csv_path
+
+
+class PipelineContext:
+    """
+    The shared frames for one run of the data pipeline, keyed by the names above.
+
+    Frames are loaded the first time they're requested (if an earlier step in this run hasn't
+    already set them), and any frame a step sets is written out by write_outputs().
+    """
+
+    def __init__(self) -> None:
+        self.frames: Dict[str, pd.DataFrame] = {}
+
+        # The frames that have been set since they were last written, in the order they were set
+        self.changed: List[str] = []
+
+    def get(self, name: str) -> pd.DataFrame:
+        """Get a shared frame, loading it if no step has set it yet"""
+        if name not in self.frames:
+            self.frames[name] = load_pipeline_frame(name)
+
+        return self.frames[name]
+
+    def set(self, name: str, data: pd.DataFrame) -> None:
+        """Replace a shared frame, marking it to be written out at the end of the run"""
+        self.frames[name] = data
+
+        if name not in self.changed:
+            self.changed.append(name)
+
+    def write_outputs(self) -> List[str]:
+        """Write every frame that was set, returning the CSV paths written to"""
+        outputted_paths = [
+            save_pipeline_frame(name, self.frames[name]) for name in self.changed
+        ]
+
+        self.changed = []
+
+        return outputted_paths
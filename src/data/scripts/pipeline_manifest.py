@@ -0,0 +1,190 @@
+"""
+Pipeline Manifest - Lets run_all.py skip pipeline steps whose inputs haven't changed
+
+Each step gets a key, a hash of its code (its module and the src.data.scripts modules it imports),
+the source files it reads, and the keys of the steps that produce the data it reads, so changing a
+step's code or inputs changes the key of that step and every step downstream of it.
+
+After a step runs, we copy everything it output into its own folder in the debug cache and record its
+key in the manifest. On the next run, a step with the same key is skipped and its outputs are copied
+back from the cache, so the steps after it that do need to run still get the data they expect.
+
+For the frames a step outputs we only cache their typed copies, since the CSVs can be rebuilt from
+them, and the in-process pipeline only writes its CSVs once at the end of the run.
+"""
+
+import ast
+import hashlib
+import json
+import os
+import shutil
+
+import pandas as pd
+
+from typing import Dict, List, cast
+
+from src.data.scripts.pipeline_context import (
+    PipelineContext,
+    get_pipeline_frame_path,
+    save_pipeline_frame,
+)
+from src.data.scripts.utils import get_data_file_path, hash_file
+
+manifest_path = get_data_file_path("debug", "pipeline-manifest.json")
+cache_directory = get_data_file_path("debug", "pipeline-cache")
+
+# The package our steps live in, the only imports we track for a step's code version
+scripts_package = "src.data.scripts"
+
+
+def get_module_path(module: str) -> str:
+    """Get the path of a module's source file from its name, e.g. src.data.scripts.utils"""
+    return module.replace(".", os.sep) + ".py"
+
+
+def get_code_files(module: str) -> List[str]:
+    """
+    Get the source files for a step's code version - its module and every module in
+    src.data.scripts it imports, directly or through another module. Found by reading the imports
+    rather than importing, since some modules load data when imported
+    """
+    code_files = []
+    modules_to_check = [module]
+
+    while modules_to_check:
+        module_path = get_module_path(modules_to_check.pop())
+
+        if module_path in code_files or not os.path.exists(module_path):
+            continue
+
+        code_files.append(module_path)
+
+        with open(module_path, "r", encoding="utf-8") as f:
+            tree = ast.parse(f.read())
+
+        for node in ast.walk(tree):
+            if isinstance(node, ast.ImportFrom) and node.module:
+                imported_modules = [node.module]
+            elif isinstance(node, ast.Import):
+                imported_modules = [alias.name for alias in node.names]
+            else:
+                continue
+
+            modules_to_check += [
+                imported
+                for imported in imported_modules
+                if imported.startswith(scripts_package)
+            ]
+
+    return sorted(code_files)
+
+
+def get_step_keys(pipeline_steps: List[Dict]) -> List[str]:
+    """
+    Get the key for each step, from its code, its input files, and the keys of the latest earlier
+    steps that output each of its input frames
+    """
+    step_keys = []
+
+    # The key of the step that last output each frame
+    frame_keys: Dict[str, str] = {}
+
+    for step in pipeline_steps:
+        step_hash = hashlib.sha256()
+
+        for path in get_code_files(step["module"]) + step["input_files"]:
+            step_hash.update(f"{path}:{hash_file(path)}\n".encode())
+
+        for name in step["inputs"]:
+            step_hash.update(f"{name}:{frame_keys.get(name, 'none')}\n".encode())
+
+        step_key = step_hash.hexdigest()
+        step_keys.append(step_key)
+
+        for name in step["outputs"]:
+            frame_keys[name] = step_key
+
+    return step_keys
+
+
+def load_manifest() -> Dict[str, str]:
+    """Load the key each step last ran with, by module. Empty if we've never run the pipeline"""
+    if not os.path.exists(manifest_path):
+        return {}
+
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest: Dict[str, str]) -> None:
+    """Save the key each step last ran with, by module"""
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+        f.write("\n")
+
+
+def get_step_output_paths(step: Dict) -> List[str]:
+    """Get every file we cache for a step, its frames' typed copies and the files it writes directly"""
+    frame_paths = [get_pipeline_frame_path(name) for name in step["outputs"]]
+
+    return frame_paths + step["output_files"]
+
+
+def get_step_cache_directory(step: Dict) -> str:
+    """Get the folder we cache a step's outputs in, named after its module"""
+    return os.path.join(cache_directory, step["module"].split(".")[-1])
+
+
+def get_step_cache_path(step: Dict, output_path: str) -> str:
+    """Get where we cache one of a step's output files"""
+    return os.path.join(get_step_cache_directory(step), os.path.basename(output_path))
+
+
+def can_skip_step(step: Dict, step_key: str, manifest: Dict[str, str]) -> bool:
+    """Whether a step last ran with the same key, and we still have all of its outputs cached"""
+    return manifest.get(step["module"]) == step_key and all(
+        os.path.exists(get_step_cache_path(step, path))
+        for path in get_step_output_paths(step)
+    )
+
+
+def cache_step_outputs(step: Dict, context: PipelineContext | None = None) -> None:
+    """
+    Cache everything a step just output. Frames are pickled from the context if the step ran
+    in-process (since they're only written to their own files at the end of the run), and otherwise
+    copied from the typed copies the step wrote
+    """
+    os.makedirs(get_step_cache_directory(step), exist_ok=True)
+
+    for name in step["outputs"]:
+        frame_path = get_pipeline_frame_path(name)
+
+        if context is not None:
+            context.get(name).to_pickle(get_step_cache_path(step, frame_path))
+        else:
+            shutil.copyfile(frame_path, get_step_cache_path(step, frame_path))
+
+    for path in step["output_files"]:
+        shutil.copyfile(path, get_step_cache_path(step, path))
+
+
+def restore_step_outputs(step: Dict, context: PipelineContext | None = None) -> None:
+    """
+    Put a skipped step's cached outputs back. Its frames are set in the context if we have one, to
+    be written out with the rest at the end of the run, and otherwise written to their CSVs and
+    typed copies for the next step to read
+    """
+    for name in step["outputs"]:
+        data = cast(
+            pd.DataFrame,
+            pd.read_pickle(get_step_cache_path(step, get_pipeline_frame_path(name))),
+        )
+
+        if context is not None:
+            context.set(name, data)
+        else:
+            save_pipeline_frame(name, data)
+
+    for path in step["output_files"]:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copyfile(get_step_cache_path(step, path), path)
@@ -6,18 +6,16 @@ Ranks all buildings in the latest year and generates overall city-wide statistic
 which is what shows up on the page for each building.
 """
 
-import json
 import pandas
 
 from typing import List
 from src.data.scripts.grade_buildings import grade_buildings, grade_cols
 from src.data.scripts.add_ward_numbers import add_ward_numbers
 from src.data.scripts.utils import (
-    get_and_clean_csv,
-    json_data_builder,
+    iter_json_records,
     get_data_file_path,
     log_step_completion,
-    output_to_csv,
+    write_json_records,
     write_json_with_newline,
 )
 from src.data.scripts.building_utils import (
@@ -26,6 +24,14 @@ from src.data.scripts.building_utils import (
     benchmarking_int_cols,
 )
 from src.data.scripts.generate_historic_stats import calculateFirstAndLastYearReported
+from src.data.scripts.pipeline_context import (
+    PipelineContext,
+    NEWEST_DATA,
+    BUILDING_BENCHMARKS,
+    HISTORIC_DATA,
+    load_pipeline_frame,
+    save_pipeline_frame,
+)
 
 # Assume run in /data
 data_directory = "source"
@@ -34,16 +40,9 @@ data_out_directory = "dist"
 # The /debug directory is to have a well formatted JSON for reading
 data_debug_directory = "debug"
 
-# The input file from the previous step. Gatsby doesn't like spaces so we use a CSV with renamed
-# headers with no units
-building_emissions_file = "benchmarking-all-newest-temp.csv"
-
 # The final output file name
 building_emissions_file_out_name = "building-benchmarks"
 
-out_file_dir = "dist"
-historic_data_filename = "benchmarking-all-years.csv"
-
 # Debug flag for development
 debug = False
 
@@ -132,28 +131,36 @@ def calculateBuildingStats(building_data_in: pandas.DataFrame) -> List[str]:
 
 
 # Returns the output file path if it succeeds
-def processBuildingData() -> List[str]:
+def processBuildingData(context: PipelineContext | None = None) -> List[str]:
+    """
+    Ranks and grades the newest data for each building, writing out building-benchmarks and the
+    graded all-years data. If a pipeline context is passed, the data is read from and passed on in
+    the context instead of through CSVs.
+
+    Returns an array of files written to
+    """
+
     # Store files we write out to
     outputted_paths = []
 
-    # Read in the newest buildings data CSV from the previous pipeline step
-    building_data = get_and_clean_csv(
-        get_data_file_path(data_debug_directory, building_emissions_file)
-    )
-
-    # Convert our columns to analyze to numeric data by stripping commas, otherwise the rankings
-    # are junk
-    building_data[building_cols_to_analyze] = building_data[
-        building_cols_to_analyze
-    ].apply(
-        lambda x: pandas.to_numeric(x.astype(str).str.replace(",", ""), errors="coerce")
-    )
+    # Read in the newest buildings data from the previous pipeline step
+    if context is not None:
+        building_data = context.get(NEWEST_DATA).copy()
+    else:
+        building_data = load_pipeline_frame(NEWEST_DATA)
 
     # Mark columns that look like numbers but should be strings as such to prevent decimals showing
     # up (e.g. zipcode of 60614 or Ward 9)
     building_data[benchmarking_string_cols] = building_data[
         benchmarking_string_cols
-    ].astype(str)
+    ].astype("string")
+
+    # The exempt flag is read in as a string to prevent mixed type warnings, parse it to a boolean
+    building_data["ExemptFromChicagoEnergyRating"] = (
+        building_data["ExemptFromChicagoEnergyRating"]
+        .str.lower()
+        .map({"true": True, "false": False})
+    )
 
     # Mark columns as ints that should never show a decimal, e.g. Number of Buildings, Zipcode
     building_data[benchmarking_int_cols] = building_data[benchmarking_int_cols].astype(
@@ -194,7 +201,10 @@ def processBuildingData() -> List[str]:
     ###
 
     # Add building grades to the historic data
-    historic_data_graded = grade_buildings()
+    if context is not None:
+        historic_data_graded = grade_buildings(context.get(HISTORIC_DATA))
+    else:
+        historic_data_graded = grade_buildings(load_pipeline_frame(HISTORIC_DATA))
 
     # Copy the latest year grade data
     # latest_historical_data = historic_data_graded[historic_data_graded['DataYear'] == latest_year]
@@ -222,31 +232,22 @@ def processBuildingData() -> List[str]:
     ### Last Step - Save the Files
     ###
 
-    historic_data_path = get_data_file_path(out_file_dir, historic_data_filename)
-
     # The all years data is in it's final form already, we don't do ranks or stats off of it (yet)
-    output_to_csv(historic_data_graded, historic_data_path)
-    outputted_paths.append(historic_data_path)
-
-    # Add FirstYearReported and LastYearReported to building data
-    # Read historic data to calculate reporting years
-    historic_data_path = get_data_file_path(out_file_dir, historic_data_filename)
-    historic_data = get_and_clean_csv(historic_data_path)
-
-    # Calculate reporting years from historic data
-    reporting_years = calculateFirstAndLastYearReported(historic_data)
-
-    # Add FirstYearReported and LastYearReported columns to building_data
-    building_data["FirstYearReported"] = (
-        building_data["ID"]
-        .astype(str)
-        .map(lambda x: reporting_years.get(x, {}).get("FirstYearReported", None))
-    )
-    building_data["LastYearReported"] = (
-        building_data["ID"]
-        .astype(str)
-        .map(lambda x: reporting_years.get(x, {}).get("LastYearReported", None))
-    )
+    if context is not None:
+        context.set(HISTORIC_DATA, historic_data_graded)
+    else:
+        outputted_paths.append(save_pipeline_frame(HISTORIC_DATA, historic_data_graded))
+
+    # Add FirstYearReported and LastYearReported to building data, calculated from the graded
+    # historic data we just built (no need to read it back in from the CSV)
+    reporting_years = calculateFirstAndLastYearReported(historic_data_graded)
+
+    # Add FirstYearReported and LastYearReported columns to building_data, looked up by ID (NaN for
+    # buildings that never reported)
+    building_ids = building_data["ID"].astype(str)
+
+    for col in reporting_years.columns:
+        building_data[col] = building_ids.map(reporting_years.loc[:, col])
 
     if debug:
         matched_count = building_data["FirstYearReported"].notna().sum()
@@ -257,40 +258,29 @@ def processBuildingData() -> List[str]:
     # Add building ward numbers under col: "Ward"
     building_data = add_ward_numbers(building_data)
 
-    # Export the data
-    building_emissions_output_path = get_data_file_path(
-        data_out_directory, building_emissions_file_out_name + ".csv"
-    )
-
-    output_to_csv(building_data, building_emissions_output_path)
-
-    outputted_paths.append(building_emissions_output_path)
+    # Export the data, or pass it on to the next step in memory
+    if context is not None:
+        context.set(BUILDING_BENCHMARKS, building_data)
+    else:
+        outputted_paths.append(save_pipeline_frame(BUILDING_BENCHMARKS, building_data))
 
     # Convert the building benchmarks CSV to a JSON for debugging
-    debug_json_data = json_data_builder(
-        building_data,
-        "building_benchmarks",
-        is_array=True,
-        array_key="building_benchmarks",
-    )
-
     debug_benchmarks_path = get_data_file_path(
         data_debug_directory, building_emissions_file_out_name + ".json"
     )
 
     # We write out files to a /debug directory that is .gitignored with indentation to
-    # make it readable but to not have to store giant files
-    with open(debug_benchmarks_path, "w", encoding="utf-8") as f:
-        json.dump(debug_json_data, f, ensure_ascii=True, indent=4)
-        f.write("\n")  # Add EOF newline
+    # make it readable but to not have to store giant files. Written one building at a time, so we
+    # don't build the whole JSON in memory
+    write_json_records(iter_json_records(building_data), debug_benchmarks_path)
 
     outputted_paths.append(debug_benchmarks_path)
 
     return outputted_paths
 
 
-def main() -> None:
-    outputted_paths = processBuildingData()
+def main(context: PipelineContext | None = None) -> None:
+    outputted_paths = processBuildingData(context)
 
     log_step_completion(2, outputted_paths)
 
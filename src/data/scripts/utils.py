@@ -3,13 +3,17 @@ Utils - Basic utilities for file processing that are agnostic to the specific
 data being processed
 """
 
+import hashlib
 import json
+import os
 from pyproj import Transformer
 from shapely.geometry import shape
 import pandas as pd
 import pathlib
 
-from typing import Any, List, cast
+from typing import Any, Iterable, Iterator, List, cast
+
+from src.data.scripts.benchmarking_schema import csv_dtypes, required_int_csv_cols
 
 # ANSI color codes for output
 RED = "\033[0;31m"
@@ -62,22 +66,80 @@ def get_data_file_path(dir: str, f: str) -> str:
     return str(path)
 
 
-def get_and_clean_csv(path_to_csv, cols_to_keep=None) -> pd.DataFrame:
-    """Fetch a building benchmarking CSV in Pandas, keeping the cols_to_keep (if specified)"""
+def hash_file(path: str) -> str:
+    """Get the SHA-256 hash of a file's contents, or a marker if it doesn't exist"""
+    if not os.path.exists(path):
+        return "missing"
+
+    file_hash = hashlib.sha256()
+
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            file_hash.update(chunk)
+
+    return file_hash.hexdigest()
+
+
+# How we read every benchmarking CSV, parsing the columns in our schema straight to their types
+csv_read_options = {
+    "dtype": csv_dtypes,
+    # The city formats some large numbers with commas, e.g. "1,234.5"
+    "thousands": ",",
+}
+
+
+def drop_rows_missing_keys(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Drop any rows without an ID or data year, since they can't be tied to a building's year, and
+    store those columns as plain ints now that none are missing
+    """
+    key_cols = [col for col in df.columns if col in required_int_csv_cols]
+    missing_key = df.loc[:, key_cols].isna().any(axis=1)
+
+    if missing_key.any():
+        print_yellow(
+            f"Dropping {missing_key.sum()} rows with no {' or '.join(key_cols)}"
+        )
+        df = cast(pd.DataFrame, df.loc[~missing_key]).copy()
 
-    # Create a dictionary mapping column names (or indices) to dtypes:
-    data_types = {
-        # Specify that "Exempt From Chicago Energy Rating" column is a string, preventing default
-        # boolean parsing and warning of mixed types
-        7: "string",
-    }
+    for col in key_cols:
+        df[col] = df[col].astype("int64")
 
-    df = pd.read_csv(path_to_csv, dtype=data_types)  # type: ignore
+    return df
+
+
+def get_and_clean_csv(path_to_csv, cols_to_keep=None) -> pd.DataFrame:
+    """
+    Fetch a building benchmarking CSV in Pandas, keeping the cols_to_keep (if specified). Columns in
+    our benchmarking schema are parsed straight to their declared types, and only the columns kept
+    are read at all. Rows missing an ID or data year are dropped
+    """
+    df = pd.read_csv(path_to_csv, usecols=cols_to_keep, **csv_read_options)  # type: ignore
+    df = drop_rows_missing_keys(df)
 
     if cols_to_keep is None:
         return df
     else:
-        return df[cols_to_keep]
+        # Reading only some columns keeps the file's order, so put them in the order asked for
+        return df.loc[:, cols_to_keep]
+
+
+def iter_csv_chunks(
+    path_to_csv, chunk_size: int, cols_to_keep=None
+) -> Iterator[pd.DataFrame]:
+    """
+    Read a building benchmarking CSV like get_and_clean_csv, but chunk_size rows at a time, for
+    files too big to hold in memory at once
+    """
+    with pd.read_csv(
+        path_to_csv,
+        usecols=cols_to_keep,
+        chunksize=chunk_size,
+        **csv_read_options,  # type: ignore
+    ) as reader:
+        for chunk in reader:
+            chunk = drop_rows_missing_keys(chunk)
+            yield chunk if cols_to_keep is None else chunk.loc[:, cols_to_keep]
 
 
 def output_to_csv(building_data: pd.DataFrame, output_path: str) -> None:
@@ -85,34 +147,64 @@ def output_to_csv(building_data: pd.DataFrame, output_path: str) -> None:
     building_data.to_csv(output_path, sep=",", encoding="utf-8", index=False)
 
 
+def iter_json_records(
+    dataframe: pd.DataFrame, chunk_size: int = 1000
+) -> Iterator[dict]:
+    """Yield a JSON ready dict for each unique building ID in a dataframe (from the first row with
+    that ID), with missing values as empty strings. Converts chunk_size rows at a time, so we never
+    hold more than a chunk of dicts in memory"""
+
+    uniqueColKey = "ID"
+
+    unique_buildings = dataframe.drop_duplicates(subset=uniqueColKey)
+
+    for start in range(0, len(unique_buildings), chunk_size):
+        chunk = unique_buildings.iloc[start : start + chunk_size]
+
+        yield from chunk.astype(object).where(chunk.notna(), "").to_dict("records")
+
+
 def json_data_builder(
     dataframe, outer_tag="default", is_array=True, array_key="emissionsByYear"
-) -> List[str]:
-    """Process the a CSV dataframe into a JSON object"""
+) -> List[dict]:
+    """Process the a CSV dataframe into a JSON object, one record per unique building ID"""
 
-    uniqueColKey = "ID"
+    return list(iter_json_records(dataframe))
+
+
+def write_json_records(
+    records: Iterable[dict], file_path: str, indent: int = 4
+) -> None:
+    """
+    Write records out as a JSON array one record at a time, so the whole array never has to be
+    built in memory. Formatted the same as json.dump with the same indent, plus an EOF newline.
+
+    Args:
+        records: The records to write, e.g. from iter_json_records
+        file_path: Path to the output file
+        indent: Indentation level
+    """
+    record_indent = "\n" + " " * indent
+
+    with open(file_path, "w", encoding="utf-8") as f:
+        f.write("[")
+
+        wrote_records = False
 
-    dataframe = dataframe.map(lambda x: "" if pd.isnull(x) else x)
+        for record in records:
+            if wrote_records:
+                f.write(",")
 
-    # initiate empty json object to iterate with
-    json_object = []
+            record_json = json.dumps(record, ensure_ascii=True, indent=indent)
+            f.write(record_indent + record_json.replace("\n", record_indent))
+            wrote_records = True
 
-    # grab list of unique states for for_loop
-    unique_buildings = list(set(dataframe[uniqueColKey]))
+        f.write("\n]\n" if wrote_records else "]\n")
 
-    for building in unique_buildings:
-        building_df = dataframe.loc[dataframe[uniqueColKey] == building]
-        # # need to set building as the index here, so it's not duplicated in our final json
-        # if is_array:
-        #     building_df.set_index(uniqueColKey, inplace=True)
-        #     building_json = building_df.to_dict('records')
-        #     json_object.append({"building": building, array_key: building_json})
-        # else:
-        building_json = building_df.to_dict("records")[0]
-        json_object.append(building_json)
 
-    # Return outer tag output object
-    return json_object
+def get_memory_usage_mb(data: pd.DataFrame) -> float:
+    """Get how much memory a frame takes up in MB, including the contents of its strings"""
+    return data.memory_usage(deep=True).sum() / (1024 * 1024)
 
 
 def log_step_completion(step_num, outputted_paths):
@@ -127,6 +219,7 @@ def log_step_completion(step_num, outputted_paths):
         step_num (int): The number of the completed step (e.g., 1, 2, 3).
         outputted_paths (list): A list of file paths (strings or Path objects)
             that were outputted by the step.  May contain None values which are ignored.
+            Empty if the step only updated data held in memory for the next step.
 
     Returns:
         None
@@ -143,6 +236,10 @@ def log_step_completion(step_num, outputted_paths):
             else:
                 other_paths.append(path_str)
 
+    if not debug_paths and not other_paths:
+        print(f"Step {step_num} data processing done! Data passed on in memory.")
+        return
+
     print(f"Step {step_num} data processing done! Files exported/updated:\n")
 
     for path in debug_paths:
@@ -206,11 +303,11 @@ def apply_verified_coordinates(
     if not geojson:
         return building_data
 
-    # To use if properties.geojson.coordinates are not provided for a building
-    # Takes IL State Plane feet from geometry.coordinates & converts to lon, lat
-    transformer = Transformer.from_crs("EPSG:3435", "EPSG:4326", always_xy=True)
+    # Each feature's (lon, lat) or IL State Plane (x, y) point, by building ID (a later feature for
+    # the same building replaces an earlier one)
+    wgs84_points = {}
+    state_plane_points = {}
 
-    verified_coords = {}
     for feature in geojson["features"]:
         props = feature["properties"]
         building_id = int(props["building_id"])
@@ -218,35 +315,48 @@ def apply_verified_coordinates(
         # Prefer WGS84 (lon, lat) coordinates if available
         geojson_val = parse_geojson_field(props.get("geojson"))
         if geojson_val and geojson_val.get("coordinates"):
-            lon, lat = extract_lon_lat(geojson_val)
+            wgs84_points[building_id] = extract_lon_lat(geojson_val)
+            state_plane_points.pop(building_id, None)
 
-        # Else, convert IL state plane units
+        # Else, we'll need to convert IL state plane units
         elif feature.get("geometry") and feature["geometry"].get("coordinates"):
-            lon, lat = extract_lon_lat(feature["geometry"], transformer)
-        else:
-            continue
+            state_plane_points[building_id] = extract_lon_lat(feature["geometry"])
+            wgs84_points.pop(building_id, None)
 
-        verified_coords[building_id] = (lat, lon)
+    # To use if properties.geojson.coordinates are not provided for a building
+    # Converts all IL State Plane feet points to lon, lat in one call
+    if state_plane_points:
+        transformer = Transformer.from_crs("EPSG:3435", "EPSG:4326", always_xy=True)
+        xs, ys = zip(*state_plane_points.values())
+        lons, lats = transformer.transform(list(xs), list(ys))
+
+        wgs84_points.update(zip(state_plane_points.keys(), zip(lons, lats)))
+
+    # The verified coordinates by building ID, kept as Python objects so they're formatted the
+    # same as the source data
+    verified_coords = pd.DataFrame.from_dict(
+        {
+            building_id: (lat, lon, f"({lat}, {lon})")
+            for building_id, (lon, lat) in wgs84_points.items()
+        },
+        orient="index",
+        columns=pd.Index(["Latitude", "Longitude", "Location"]),
+        dtype=object,
+    )
 
     # Override only where verified data exists
-    def override_lat(row):
-        bid = int(row["ID"]) if pd.notna(row["ID"]) else None
-        return verified_coords[bid][0] if bid in verified_coords else row["Latitude"]
-
-    def override_lon(row):
-        bid = int(row["ID"]) if pd.notna(row["ID"]) else None
-        return verified_coords[bid][1] if bid in verified_coords else row["Longitude"]
-
-    def override_location(row):
-        bid = int(row["ID"]) if pd.notna(row["ID"]) else None
-        if bid in verified_coords:
-            lat, lon = verified_coords[bid]
-            return f"({lat}, {lon})"
-        return row["Location"]
-
-    building_data["Latitude"] = building_data.apply(override_lat, axis=1)
-    building_data["Longitude"] = building_data.apply(override_lon, axis=1)
-    building_data["Location"] = building_data.apply(override_location, axis=1)
+    building_ids = pd.Series(
+        pd.to_numeric(building_data["ID"], errors="coerce"), index=building_data.index
+    ).astype("Int64")
+    has_verified_coords = building_ids.isin(verified_coords.index)
+
+    for col in ["Latitude", "Longitude", "Location"]:
+        building_data[col] = (
+            building_data[col]
+            .astype(object)
+            .mask(has_verified_coords, building_ids.map(verified_coords.loc[:, col]))
+            .infer_objects()
+        )
 
     return building_data
 
@@ -257,12 +367,17 @@ def correct_building_locations(
     """Applies corrected geocodes to buildings in city data"""
     loc_data = fetch_geojson_coordinates(geojson_path)
 
-    # Log any changes made
-    original = building_data[["Latitude", "Longitude", "Location"]].copy()
+    # Log any changes made, comparing coordinates by value since they're read in as text
+    original = building_data.loc[:, ["Latitude", "Longitude", "Location"]].copy()
     result = apply_verified_coordinates(building_data, loc_data)
+    coords_changed = (
+        result.loc[:, ["Latitude", "Longitude"]]
+        .apply(pd.to_numeric, errors="coerce")
+        .ne(original[["Latitude", "Longitude"]].apply(pd.to_numeric, errors="coerce"))
+    )
     rows_changed = cast(
         pd.Series,
-        result[["Latitude", "Longitude", "Location"]].ne(original).any(axis=1),
+        coords_changed.any(axis=1) | result["Location"].ne(original["Location"]),
     )
     changed = int(rows_changed.sum())
     print(
@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.data.scripts.building_panel import BuildingPanel, get_building_panel
+
+
+@pytest.fixture
+def historic_data():
+    """Three buildings out of order, with a building missing a year and a missing value"""
+    return pd.DataFrame(
+        {
+            "ID": [30, 10, 10, 20, 30, 10],
+            "DataYear": [2022, 2022, 2020, 2021, 2021, 2021],
+            "NaturalGasUse": [5.0, 3.0, 1.0, None, 4.0, 2.0],
+        }
+    )
+
+
+def test_panel_lays_out_values_by_building_and_year(historic_data):
+    """Test each value lands in its building's row and year's column, in sorted order"""
+    panel = BuildingPanel(historic_data, ["NaturalGasUse"])
+
+    assert panel.building_ids.tolist() == [10, 20, 30]
+    assert panel.years.tolist() == [2020, 2021, 2022]
+
+    np.testing.assert_array_equal(
+        panel["NaturalGasUse"],
+        [
+            [1.0, 2.0, 3.0],
+            [np.nan, np.nan, np.nan],
+            [np.nan, 4.0, 5.0],
+        ],
+    )
+    # A missing value still counts as a record, unlike a missing year
+    np.testing.assert_array_equal(
+        panel.has_record,
+        [
+            [True, True, True],
+            [False, True, False],
+            [False, True, True],
+        ],
+    )
+    assert "NaturalGasUse" in panel
+    assert "ElectricityUse" not in panel
+
+
+def test_get_rows_looks_up_buildings_by_id(historic_data):
+    """Test building IDs map to their rows, with -1 for buildings we don't have"""
+    panel = BuildingPanel(historic_data, [])
+
+    assert panel.get_rows([30, 10, 99]).tolist() == [2, 0, -1]
+
+
+def test_first_and_last_years(historic_data):
+    """Test the first and last year each building has a value"""
+    panel = BuildingPanel(historic_data, ["NaturalGasUse"])
+    has_gas_use = ~np.isnan(panel["NaturalGasUse"])
+
+    first_years = panel.by_building(panel.first_years(has_gas_use))
+    last_years = panel.by_building(panel.last_years(has_gas_use))
+
+    assert first_years.loc[[10, 30]].tolist() == [2020, 2021]
+    assert last_years.loc[[10, 30]].tolist() == [2022, 2022]
+
+
+def test_empty_panel():
+    """Test a panel of no data has no buildings or years"""
+    panel = BuildingPanel(
+        pd.DataFrame({"ID": [], "DataYear": [], "NaturalGasUse": []}),
+        ["NaturalGasUse"],
+    )
+
+    assert panel["NaturalGasUse"].shape == (0, 0)
+    assert panel.first_years(panel.has_record).size == 0
+
+
+def test_duplicate_records_use_largest_value():
+    """Test a building with more than one record for a year gets its largest value, not its last"""
+    historic_data = pd.DataFrame(
+        {
+            "ID": [10, 10, 10, 20],
+            "DataYear": [2020, 2020, 2021, 2020],
+            "NaturalGasUse": [3.0, 1.0, None, None],
+            "HasReportedData": [True, False, False, False],
+        }
+    )
+
+    panel = BuildingPanel(historic_data, ["NaturalGasUse", "HasReportedData"])
+
+    np.testing.assert_array_equal(
+        panel["NaturalGasUse"], [[3.0, np.nan], [np.nan, np.nan]]
+    )
+    np.testing.assert_array_equal(panel["HasReportedData"], [[1.0, 0.0], [0.0, np.nan]])
+
+
+def test_get_building_panel_is_shared_by_frame(historic_data):
+    """Test the same frame gets the same panel, with the columns added to it, and a new frame doesn't"""
+    panel = get_building_panel(historic_data)
+    gas_use = panel.get_column(
+        "NaturalGasUse", lambda: historic_data.loc[:, "NaturalGasUse"]
+    )
+
+    assert get_building_panel(historic_data) is panel
+    assert panel.get_column("NaturalGasUse", lambda: pytest.fail()) is gas_use
+
+    other_panel = get_building_panel(historic_data.copy())
+
+    assert other_panel is not panel
+    assert "NaturalGasUse" not in other_panel
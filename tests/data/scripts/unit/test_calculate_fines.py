@@ -1,10 +1,21 @@
 import pandas as pd
+import pytest
 from unittest.mock import patch
 import json
 import tempfile
 import os
 
-from src.data.scripts.calculate_fines import calculate_fines, ANNUAL_MAX_FINE
+from src.data.scripts.calculate_fines import (
+    calculate_fines,
+    calculate_fines_by_year,
+    main,
+    ANNUAL_MAX_FINE,
+)
+from src.data.scripts.pipeline_context import (
+    BUILDING_BENCHMARKS,
+    HISTORIC_DATA,
+    PipelineContext,
+)
 
 
 def test_calculate_fines_basic():
@@ -23,7 +34,7 @@ def test_calculate_fines_basic():
     )
 
     with patch(
-        "src.data.scripts.calculate_fines.get_and_clean_csv", return_value=mock_data
+        "src.data.scripts.calculate_fines.load_pipeline_frame", return_value=mock_data
     ):
         with patch("src.data.scripts.calculate_fines.get_data_file_path") as mock_path:
             with tempfile.NamedTemporaryFile(mode="w", delete=False) as tmp:
@@ -69,7 +80,7 @@ def test_calculate_fines_no_violations():
     )
 
     with patch(
-        "src.data.scripts.calculate_fines.get_and_clean_csv", return_value=mock_data
+        "src.data.scripts.calculate_fines.load_pipeline_frame", return_value=mock_data
     ):
         with patch("src.data.scripts.calculate_fines.get_data_file_path") as mock_path:
             with tempfile.NamedTemporaryFile(mode="w", delete=False) as tmp:
@@ -100,7 +111,7 @@ def test_calculate_fines_all_violations():
     )
 
     with patch(
-        "src.data.scripts.calculate_fines.get_and_clean_csv", return_value=mock_data
+        "src.data.scripts.calculate_fines.load_pipeline_frame", return_value=mock_data
     ):
         with patch("src.data.scripts.calculate_fines.get_data_file_path") as mock_path:
             with tempfile.NamedTemporaryFile(mode="w", delete=False) as tmp:
@@ -124,3 +135,116 @@ def test_calculate_fines_all_violations():
 
                 finally:
                     os.unlink(tmp.name)
+
+
+def test_calculate_fines_by_year_max_fine_by_year():
+    """Test a fine model with a different max fine for some years."""
+    mock_data = pd.DataFrame(
+        {
+            "ReportingStatus": ["Not Submitted"] * 3 + ["Submitted"],
+            "DataYear": [2020, 2021, 2021, 2021],
+        }
+    )
+
+    fines_data = calculate_fines_by_year(mock_data, max_fine_by_year={2021: 5000})
+
+    # Years not in the model fall back to the annual max fine
+    assert fines_data == {
+        "2020": {"fines": ANNUAL_MAX_FINE, "count": 1},
+        "2021": {"fines": 2 * 5000, "count": 2},
+        "total": {"count": 3, "fines": ANNUAL_MAX_FINE + 2 * 5000},
+    }
+
+
+def test_calculate_fines_by_year_fine_by_property_type():
+    """Test a fine model with fines by property type, capped at the max fine for the year."""
+    mock_data = pd.DataFrame(
+        {
+            "ReportingStatus": ["Not Submitted"] * 4,
+            "DataYear": [2020, 2020, 2020, 2021],
+            "PrimaryPropertyType": ["Office", "K-12 School", "Hotel", "Office"],
+        }
+    )
+
+    fines_data = calculate_fines_by_year(
+        mock_data,
+        max_fine_by_year={2021: 1000},
+        fine_by_property_type={"K-12 School": 2000, "Office": 3000},
+    )
+
+    # Hotels aren't in the model, so get the max fine, and offices are capped at 1000 in 2021
+    assert fines_data["2020"] == {"fines": 3000 + 2000 + ANNUAL_MAX_FINE, "count": 3}
+    assert fines_data["2021"] == {"fines": 1000, "count": 1}
+
+
+def test_calculate_fines_by_year_looks_up_property_types():
+    """Test fines by property type look up each building's type in the building data, since the
+    historic data doesn't have them."""
+    mock_data = pd.DataFrame(
+        {
+            "ID": pd.array([1, 2, 3], dtype="int32"),
+            "ReportingStatus": ["Not Submitted"] * 3,
+            "DataYear": [2020, 2020, 2021],
+        }
+    )
+    building_data = pd.DataFrame(
+        {"ID": [2, 1], "PrimaryPropertyType": ["Hotel", "Office"]}
+    )
+
+    fines_data = calculate_fines_by_year(
+        mock_data, fine_by_property_type={"Office": 3000}, building_data=building_data
+    )
+
+    # Building 3 isn't in the building data, so gets the max fine like the hotel
+    assert fines_data["2020"] == {"fines": 3000 + ANNUAL_MAX_FINE, "count": 2}
+    assert fines_data["2021"] == {"fines": ANNUAL_MAX_FINE, "count": 1}
+
+
+def test_calculate_fines_by_year_needs_property_types():
+    """Test fines by property type without property types or building data raises an error."""
+    mock_data = pd.DataFrame(
+        {"ID": [1], "ReportingStatus": ["Not Submitted"], "DataYear": [2020]}
+    )
+
+    with pytest.raises(ValueError):
+        calculate_fines_by_year(mock_data, fine_by_property_type={"Office": 3000})
+
+
+def test_calculate_fines_loads_building_data_for_property_types():
+    """Test fines by property type load the building data if it's not given."""
+    mock_data = pd.DataFrame(
+        {"ID": [1], "ReportingStatus": ["Not Submitted"], "DataYear": [2020]}
+    )
+    building_data = pd.DataFrame({"ID": [1], "PrimaryPropertyType": ["Office"]})
+
+    with (
+        patch(
+            "src.data.scripts.calculate_fines.load_pipeline_frame",
+            return_value=building_data,
+        ) as mock_load,
+        patch("src.data.scripts.calculate_fines.write_json_with_newline") as mock_write,
+    ):
+        calculate_fines(mock_data, fine_by_property_type={"Office": 3000})
+
+    mock_load.assert_called_once_with(BUILDING_BENCHMARKS)
+    assert mock_write.call_args[0][0]["2020"] == {"fines": 3000, "count": 1}
+
+
+def test_main_calculates_fines_once():
+    """Test main uses the historic data in the context and only calculates fines once."""
+    mock_data = pd.DataFrame({"ReportingStatus": ["Not Submitted"], "DataYear": [2020]})
+    context = PipelineContext()
+    context.set(HISTORIC_DATA, mock_data)
+
+    with patch(
+        "src.data.scripts.calculate_fines.calculate_fines_by_year",
+        wraps=calculate_fines_by_year,
+    ) as mock_calculate:
+        with patch(
+            "src.data.scripts.calculate_fines.write_json_with_newline"
+        ) as mock_write:
+            main(context)
+
+    mock_calculate.assert_called_once()
+    assert mock_calculate.call_args[0][0] is mock_data
+    mock_write.assert_called_once()
@@ -4,6 +4,7 @@ import csv
 import pandas as pd
 
 from src.data.scripts import clean_and_split_data
+from src.data.scripts.utils import output_to_csv
 from tests.data.scripts.utils import get_test_file_path
 
 src_dir = "src"
@@ -157,10 +158,10 @@ def test_no_ghg_property_is_included_as_never_submitted(processed_dataframe):
 
 
 def test_csv_is_produced(processed_dataframe):
-    """confirm clean_and_split_data.output_to_csv creates
+    """confirm output_to_csv creates
     a csv on disk"""
 
     df = processed_dataframe
     output_file_path = get_test_file_path(test_output_file)
-    clean_and_split_data.output_to_csv(df, output_file_path)
+    output_to_csv(df, output_file_path)
     assert os.path.exists(output_file_path)
@@ -78,3 +78,62 @@ def test_no_ghg_property_is_excluded(processed_dataframe):
     # property ID 240068 is present in test source data but
     # 2016-2022 submitted data has no GHGIntensity data
     assert len(df[df["ID"] == "240068"]) == 0
+
+
+def test_one_read_matches_separate_reads(processed_dataframe):
+    """Processing the data read once both ways gives the same results as reading it for each, and
+    doesn't change the data read in"""
+    input_filename = get_test_file_path(test_input_file)
+    building_data = clean_and_split_data.load_source_data(input_filename)
+    original = building_data.copy()
+
+    latest_year = clean_and_split_data.process_source_data(building_data, True)
+    all_years = clean_and_split_data.process_source_data(building_data, False)
+
+    pd.testing.assert_frame_equal(building_data, original)
+    pd.testing.assert_frame_equal(all_years, processed_dataframe)
+    pd.testing.assert_frame_equal(
+        latest_year, clean_and_split_data.process(input_filename, True)
+    )
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1000])
+def test_chunked_processing_matches_full_read(chunk_size):
+    """Streaming the source file in chunks gives the same data as reading it all at once"""
+    input_filename = get_test_file_path(test_input_file)
+    building_data = clean_and_split_data.load_source_data(input_filename)
+
+    latest_year, all_years = clean_and_split_data.process_source_data_in_chunks(
+        input_filename, chunk_size
+    )
+
+    pd.testing.assert_frame_equal(
+        latest_year, clean_and_split_data.process_source_data(building_data, True)
+    )
+    pd.testing.assert_frame_equal(
+        all_years, clean_and_split_data.process_source_data(building_data, False)
+    )
+
+
+@pytest.mark.parametrize(
+    "env_value, expected", [(None, None), ("", None), ("5000", 5000)]
+)
+def test_source_chunk_size_from_environment(monkeypatch, env_value, expected):
+    """The chunk size to stream the source file in comes from the environment, if set"""
+    if env_value is None:
+        monkeypatch.delenv(
+            clean_and_split_data.source_chunk_size_env_var, raising=False
+        )
+    else:
+        monkeypatch.setenv(clean_and_split_data.source_chunk_size_env_var, env_value)
+
+    assert clean_and_split_data.get_source_chunk_size() == expected
+
+
+@pytest.mark.parametrize("env_value", ["0", "-10", "lots"])
+def test_invalid_source_chunk_size_raises(monkeypatch, env_value):
+    """A chunk size that isn't a positive number of rows is an error, not silently ignored"""
+    monkeypatch.setenv(clean_and_split_data.source_chunk_size_env_var, env_value)
+
+    with pytest.raises(ValueError):
+        clean_and_split_data.get_source_chunk_size()
@@ -1,10 +1,17 @@
+import numpy as np
 import pytest
 import pandas as pd
 from pandas.testing import assert_series_equal
 from src.data.scripts.detect_anomalous_buildings import (
+    calculate_max_gas_deltas,
     detect_anomalous_zero_gas_buildings,
+    detect_gas_users,
+    determine_abs_delta,
     detect_large_gas_swing_buildings,
     find_and_note_anomalies,
+    find_outlier_years,
+    get_building_history,
+    anomaly_detectors,
     anomaly_values,
 )
 
@@ -16,6 +23,7 @@ def test_detect_large_gas_swing_buildings_threshold_100Prcnt():
     mock_data = pd.DataFrame(
         {
             "ID": [1, 1, 1, 2, 2, 2, 3, 3, 3],
+            "DataYear": [2020, 2021, 2022, 2020, 2021, 2022, 2020, 2021, 2022],
             "NaturalGasUse": [10, 12, 28, 100, 110, 105, 8, 2, 1],
             "ElectricityUse": [10, 12, 28, 100, 110, 105, 8, 2, 1],
         }
@@ -33,6 +41,20 @@ def test_detect_large_gas_swing_buildings_with_threshold_70Prcnt():
     mock_data = pd.DataFrame(
         {
             "ID": [1, 1, 1, 2, 2, 2, 3, 3, 3, 4, 4, 4],
+            "DataYear": [
+                2020,
+                2021,
+                2022,
+                2020,
+                2021,
+                2022,
+                2020,
+                2021,
+                2022,
+                2020,
+                2021,
+                2022,
+            ],
             "NaturalGasUse": [10, 12, 28, 100, 110, 105, 8, 2, 1, 6, 2, 1],
             "ElectricityUse": [4, 3, 2, 5, 6, 90, 2, 4, 2, 100, 100, 100],
         }
@@ -48,6 +70,7 @@ def test_detect_large_gas_swing_buildings_with_empty_data():
     mock_data = pd.DataFrame(
         {
             "ID": [1, 1, 1, 2, 2, 2, 3, 3, 3],
+            "DataYear": [2020, 2021, 2022, 2020, 2021, 2022, 2020, 2021, 2022],
             "NaturalGasUse": [0, None, None, 0, None, 0, 30, 32, 33],
             "ElectricityUse": [0, None, None, 0, None, 0, 30, 32, 33],
         }
@@ -58,6 +81,53 @@ def test_detect_large_gas_swing_buildings_with_empty_data():
     assert sorted(anom_ids) == sorted(expected_ids)
 
 
+@pytest.mark.parametrize(
+    "gas_use, electric_use",
+    [
+        ([10, 12, 28, 100, 110, 105, 8, 2, 1], [10, 12, 28, 100, 110, 105, 8, 2, 1]),
+        (
+            [0, None, None, 0, None, 0, 30, 32, 33],
+            [0, None, None, 0, None, 0, 30, 32, 33],
+        ),
+        # Buildings that only report no gas, even with negative electric use
+        ([0, 0, 0, 5, 0, 7, 30, 0, 33], [-1, -1, -1, 5, 5, 5, 30, 30, 30]),
+    ],
+)
+def test_calculate_max_gas_deltas_matches_determine_abs_delta(gas_use, electric_use):
+    """Test the vectorized max gas change matches calling determine_abs_delta per building"""
+    historic_data = pd.DataFrame(
+        {
+            "ID": [1, 1, 1, 2, 2, 2, 3, 3, 3],
+            "NaturalGasUse": gas_use,
+            "ElectricityUse": electric_use,
+        }
+    )
+    gas_users = detect_gas_users(historic_data)
+
+    expected = gas_users.groupby("ID")["NaturalGasUse"].agg(determine_abs_delta)
+
+    assert_series_equal(calculate_max_gas_deltas(gas_users), expected)
+
+
+def test_calculate_max_gas_deltas_matches_determine_abs_delta_at_scale():
+    """Test the vectorized max gas change on many buildings of varying history lengths"""
+    rng = np.random.default_rng(3)
+    num_rows = 2000
+
+    historic_data = pd.DataFrame(
+        {
+            "ID": np.sort(rng.integers(1, 300, num_rows)),
+            "NaturalGasUse": rng.lognormal(8, 2, num_rows).round(1),
+            "ElectricityUse": rng.lognormal(8, 2, num_rows).round(1),
+        }
+    )
+    gas_users = detect_gas_users(historic_data)
+
+    expected = gas_users.groupby("ID")["NaturalGasUse"].agg(determine_abs_delta)
+
+    assert_series_equal(calculate_max_gas_deltas(gas_users), expected)
+
+
 def test_detect_anomalous_zero_gas_buildings():
     # Create sample historic data, with IDs 1 & 2 being anomalous, and 3 & 4 being fine, with a COVID
     # 0 blip and very negligible gas use relative to electric respectively.
@@ -118,33 +188,31 @@ def test_detect_anomalous_zero_gas_buildings_with_empty_values():
     assert 6 not in anomalous_ids
 
 
-# Mock detect_anomalous_zero_gas_buildings and detect_large_gas_swing_buildings to control the returned IDs
 @pytest.fixture
-def mock_detect_anomalous_zero_gas_buildings(mocker):
-    mock = mocker.patch(
-        "src.data.scripts.detect_anomalous_buildings.detect_anomalous_zero_gas_buildings"
+def mock_anomaly_detectors(mocker):
+    """Replace our anomaly detectors with ones that flag the building IDs a test gives them"""
+    flagged_ids = {}
+
+    def mock_detector(anomaly_key):
+        return lambda history: pd.Series(
+            history.index.isin(flagged_ids.get(anomaly_key, [])), index=history.index
+        )
+
+    mocker.patch.dict(
+        "src.data.scripts.detect_anomalous_buildings.anomaly_detectors",
+        {key: mock_detector(key) for key in anomaly_detectors},
     )
-    return mock
-
 
-@pytest.fixture
-def mock_detect_large_gas_swing_buildings(mocker):
-    mock = mocker.patch(
-        "src.data.scripts.detect_anomalous_buildings.detect_large_gas_swing_buildings"
-    )
-    return mock
+    return flagged_ids
 
 
-def test_find_and_note_anomalies(
-    mock_detect_anomalous_zero_gas_buildings, mock_detect_large_gas_swing_buildings
-):
+def test_find_and_note_anomalies(mock_anomaly_detectors):
     # Sample building and historic data
     building_data = pd.DataFrame(
         {"ID": [1, 2, 3, 4], "OtherColumn": ["A", "B", "C", "D"]}
     )
 
-    # Setup historic data - this doesn't matter since we mock the detect anomalous zero gas
-    # buildings function
+    # Setup historic data - this doesn't matter since we mock the anomaly detectors
     historic_data = pd.DataFrame(
         {
             "ID": [1, 1, 1, 2, 2, 2, 3, 3, 3, 4, 4, 4],
@@ -163,12 +231,12 @@ def test_find_and_note_anomalies(
                 2022,
             ],
             "NaturalGasUse": [100, 110, 0, 50, 0, 55, 200, 180, 190, 100, 110, 120],
+            "ElectricityUse": [100] * 12,
         }
     )
 
     # Mock that buildings 2 and 4 are anomalous
-    mock_detect_anomalous_zero_gas_buildings.return_value = [2, 4]
-    mock_detect_large_gas_swing_buildings.return_value = []
+    mock_anomaly_detectors["zero_gas_but_prev_use"] = [2, 4]
 
     # ensure we copy the input data to prevent mutation
     updated_building_data = find_and_note_anomalies(building_data.copy(), historic_data)
@@ -210,3 +278,98 @@ def test_find_and_note_anomalies(
         building_data["OtherColumn"],
         check_dtype=False,
     )
+
+
+def test_find_and_note_anomalies_combines_anomalies(mock_anomaly_detectors):
+    """Test buildings with multiple anomalies list them all, joined with commas"""
+    building_data = pd.DataFrame({"ID": [1, 2, 3, 5]})
+    historic_data = pd.DataFrame(
+        {
+            "ID": [1, 2, 3],
+            "DataYear": [2022, 2022, 2022],
+            "NaturalGasUse": [0, 50, 200],
+            "ElectricityUse": [100, 100, 100],
+        }
+    )
+
+    mock_anomaly_detectors["zero_gas_but_prev_use"] = [1, 2]
+    mock_anomaly_detectors["large_gas_swing"] = [2, 3]
+
+    anomalies = find_and_note_anomalies(building_data, historic_data)["DataAnomalies"]
+
+    assert anomalies.tolist() == [
+        "gas:zero-with-prev-use",
+        "gas:zero-with-prev-use,gas:large-swings",
+        "gas:large-swings",
+        # Buildings without any history have no anomalies
+        "",
+    ]
+
+
+def test_find_and_note_anomalies_runs_real_detectors():
+    """Test the detectors flag each building from one summary of its history"""
+    building_data = pd.DataFrame({"ID": [1, 2, 3, 4]})
+    historic_data = pd.DataFrame(
+        {
+            "ID": [1, 1, 1, 2, 2, 2, 3, 3, 3, 4, 4, 4],
+            # Out of order, since we sort each building's years ourselves
+            "DataYear": [2022, 2020, 2021] * 4,
+            "NaturalGasUse": [0, 100, 110, 0, 50, 200, 190, 200, 180, 120, 100, 110],
+            "ElectricityUse": [100] * 12,
+        }
+    )
+
+    anomalies = find_and_note_anomalies(building_data, historic_data)["DataAnomalies"]
+
+    assert anomalies.tolist() == [
+        # Went to zero, but steady before that, so that year is an outlier too
+        "gas:zero-with-prev-use,gas:outlier-year",
+        # Went to zero after a big jump in gas use
+        "gas:zero-with-prev-use,gas:large-swings",
+        "",
+        "",
+    ]
+
+
+def test_find_outlier_years():
+    """Test a year far off from the years around it is an outlier, compared per building"""
+    values = np.array(
+        [
+            # A spike in a steady building
+            [100, 105, 98, 400, 102, 101],
+            # Steady changes, even large ones, aren't outliers
+            [100, 150, 200, 250, 300, 350],
+            # A drop to 0, with a missing year
+            [100, np.nan, 110, 0, 105, 95],
+            # Small changes in a very steady building aren't outliers
+            [100, 100, 100, 140, 100, 100],
+            # Always 0, and too few years to judge
+            [0, 0, 0, 0, 0, 0],
+            [np.nan, np.nan, 900, 5, np.nan, np.nan],
+        ]
+    )
+
+    expected = np.zeros(values.shape, dtype=bool)
+    expected[0, 3] = True
+    expected[2, 3] = True
+
+    np.testing.assert_array_equal(find_outlier_years(values), expected)
+
+
+def test_building_history_counts_outlier_years():
+    """Test the outlier years of each column are counted by building, and buildings missing a
+    column have none"""
+    historic_data = pd.DataFrame(
+        {
+            "ID": [1] * 5 + [2] * 5,
+            "DataYear": list(range(2019, 2024)) * 2,
+            "NaturalGasUse": [50, 52, 500, 49, 51, 10, 11, 12, 11, 10],
+            "ElectricityUse": [100, 101, 99, 100, 900, 100, 99, 100, 101, 100],
+        }
+    )
+
+    building_history = get_building_history(historic_data)
+
+    assert building_history["NaturalGasUseOutlierYears"].tolist() == [1, 0]
+    assert building_history["ElectricityUseOutlierYears"].tolist() == [1, 0]
+    assert building_history["SiteEUIOutlierYears"].tolist() == [0, 0]
@@ -1,4 +1,17 @@
+import os
+import numpy as np
 import pandas as pd
+import pytest
+import shapely
+from unittest.mock import patch
+
+from src.data.scripts import add_ward_numbers as ward_numbers
+from src.data.scripts.add_ward_numbers import (
+    add_ward_numbers,
+    build_ward_index,
+    find_wards_by_location,
+    get_city_geocoder_wards,
+)
 from src.data.scripts.utils import get_data_file_path
 
 building_path = get_data_file_path("dist", "building-benchmarks.csv")
@@ -22,3 +35,143 @@ def test_sample_buildings_with_wards():
     test_data = building_benchmarks_ordered.loc[property_ids_to_include]
     expected_wards = [27, 3, 42, 20, 46, 24]
     assert test_data["Ward"].to_list() == expected_wards
+
+
+def test_ward_index_matches_geocoder_rules():
+    """The ward index uses the first row for each address and skips addresses without a ward"""
+    geocoder = pd.DataFrame(
+        {
+            "Address": [
+                "1 N STATE ST",
+                "2 W MADISON ST",
+                "1 N STATE ST",
+                "3 S WELLS ST",
+            ],
+            "Wards (Current - 2023)": ["42", "---", "3", "27"],
+        }
+    )
+
+    ward_index = build_ward_index(geocoder)
+
+    assert ward_index.to_dict() == {"1 N STATE ST": 42, "3 S WELLS ST": 27}
+
+
+def test_add_ward_numbers_missing_addresses_get_negative_one():
+    """Buildings the geocoder has no ward for get -1"""
+    buildings = pd.DataFrame({"Address": ["1 N STATE ST", "NOT AN ADDRESS", None]})
+    ward_index = pd.Series({"1 N STATE ST": 42})
+
+    with (
+        patch.object(ward_numbers, "get_city_geocoder_wards", return_value=ward_index),
+        patch.object(ward_numbers, "get_ward_boundaries", return_value=None),
+    ):
+        result = add_ward_numbers(buildings)
+
+    assert result["Ward"].tolist() == [42, -1, -1]
+
+
+@pytest.fixture
+def ward_boundaries():
+    """Two side by side square wards, 1 on the left and 2 on the right"""
+    wards = [shapely.box(0, 0, 1, 1), shapely.box(1, 0, 2, 1)]
+
+    return shapely.STRtree(wards), np.array([1, 2])
+
+
+def test_find_wards_by_location(ward_boundaries):
+    """Buildings get the ward they're in, with NaN for those outside every ward or without a location"""
+    buildings = pd.DataFrame(
+        {
+            "Latitude": ["0.5", "0.5", "0.5", "5", None],
+            "Longitude": ["0.5", "1.5", "1", "5", "0.5"],
+        },
+        index=[10, 11, 12, 13, 14],
+    )
+
+    wards = find_wards_by_location(buildings, *ward_boundaries)
+
+    # The building on the border between the wards gets the first one
+    assert wards.index.tolist() == [10, 11, 12, 13, 14]
+    assert wards.tolist()[:3] == [1, 2, 1]
+    assert wards.iloc[3:].isna().all()
+
+
+def test_add_ward_numbers_falls_back_to_location(ward_boundaries):
+    """Buildings the geocoder doesn't have are found by location, without overriding the geocoder"""
+    buildings = pd.DataFrame(
+        {
+            "Address": ["1 N STATE ST", "NOT AN ADDRESS", "NOWHERE"],
+            "Latitude": [0.5, 0.5, 5],
+            "Longitude": [0.5, 1.5, 5],
+        }
+    )
+    ward_index = pd.Series({"1 N STATE ST": 42})
+
+    with (
+        patch.object(ward_numbers, "get_city_geocoder_wards", return_value=ward_index),
+        patch.object(ward_numbers, "get_ward_boundaries", return_value=ward_boundaries),
+    ):
+        result = add_ward_numbers(buildings)
+
+    assert result["Ward"].tolist() == [42, 2, -1]
+
+
+@pytest.fixture
+def city_geocoder(tmp_path):
+    """A small geocoder xlsx and somewhere to cache it, with the in-memory index cleared around it"""
+    geocoder_path = str(tmp_path / "CityGeocoder.xlsx")
+    pd.DataFrame(
+        {"Address": ["1 N STATE ST"], "Wards (Current - 2023)": ["42"]}
+    ).to_excel(geocoder_path, index=False)
+
+    get_city_geocoder_wards.cache_clear()
+
+    with (
+        patch.object(ward_numbers, "city_geocoder_path", geocoder_path),
+        patch.object(
+            ward_numbers, "city_geocoder_cache_path", str(tmp_path / "wards.pkl")
+        ),
+    ):
+        yield geocoder_path
+
+    get_city_geocoder_wards.cache_clear()
+
+
+def test_city_geocoder_wards_are_cached(city_geocoder):
+    """The xlsx is only parsed once, later loads (like a new run) use the cached index"""
+    with patch.object(pd, "read_excel", wraps=pd.read_excel) as read_excel:
+        assert get_city_geocoder_wards().to_dict() == {"1 N STATE ST": 42}
+
+        get_city_geocoder_wards.cache_clear()
+        os.utime(city_geocoder, ns=(0, 0))
+
+        # The modified time changed but the contents didn't, so we still use the cache
+        assert get_city_geocoder_wards().to_dict() == {"1 N STATE ST": 42}
+
+    assert read_excel.call_count == 1
+
+
+def test_city_geocoder_wards_rebuilt_when_geocoder_changes(city_geocoder):
+    """Updating the geocoder rebuilds the cached index"""
+    get_city_geocoder_wards()
+    get_city_geocoder_wards.cache_clear()
+
+    pd.DataFrame(
+        {"Address": ["1 N STATE ST"], "Wards (Current - 2023)": ["3"]}
+    ).to_excel(city_geocoder, index=False)
+    os.utime(city_geocoder, ns=(1, 1))
+
+    assert get_city_geocoder_wards().to_dict() == {"1 N STATE ST": 3}
+
+
+def test_ward_boundaries_file_finds_sample_buildings():
+    """The committed ward boundaries have all 50 wards, and put the sample buildings in their wards"""
+    ward_boundaries = ward_numbers.get_ward_boundaries()
+
+    assert ward_boundaries is not None
+    assert sorted(ward_boundaries[1].tolist()) == list(range(1, 51))
+
+    test_data = building_benchmarks.set_index("ID").loc[property_ids_to_include]
+    wards = find_wards_by_location(test_data, *ward_boundaries)
+
+    assert wards.tolist() == [27, 3, 42, 20, 46, 24]
@@ -1,9 +1,12 @@
+import numpy as np
 import pytest
 import pandas as pd
 from unittest.mock import patch, mock_open
 from src.data.scripts.generate_historic_stats import (
     calculateBuildingStatsByYear,
     building_cols_to_analyze,
+    clean_year_stats,
+    describe_by_year,
 )
 
 
@@ -300,7 +303,7 @@ def test_calculateBuildingStatsByYear_data_input_not_mutated(sample_building_dat
         pd.testing.assert_frame_equal(sample_building_data, original_data)
 
 
-@patch("src.data.scripts.generate_historic_stats.get_and_clean_csv")
+@patch("src.data.scripts.generate_historic_stats.load_pipeline_frame")
 @patch("src.data.scripts.generate_historic_stats.get_data_file_path")
 @patch("src.data.scripts.generate_historic_stats.log_step_completion")
 def test_main_function_integration(
@@ -309,7 +312,7 @@ def test_main_function_integration(
     """Test the main function integration"""
     from src.data.scripts.generate_historic_stats import main
 
-    # mock the csv loading
+    # mock the data loading
     mock_get_csv.return_value = sample_building_data
     mock_get_path.return_value = "/mock/path/building-data.csv"
 
@@ -324,7 +327,7 @@ def test_main_function_integration(
 
         main()
 
-        # verify the csv was loaded
+        # verify the data was loaded
         mock_get_csv.assert_called_once()
 
         # verify calculateBuildingStatsByYear was called
@@ -395,3 +398,57 @@ def test_calculateBuildingStatsByYear_with_missing_values():
 
         # TotalGHGEmissions has 2 valid values out of 3
         assert year_stats["TotalGHGEmissions"]["count"] == 2
+
+
+def test_describe_by_year_matches_describing_each_year():
+    """Test that describing all years in one groupby matches describing each year on its own"""
+    rng = np.random.default_rng(7)
+    num_rows = 400
+
+    building_data = pd.DataFrame(
+        {
+            "DataYear": rng.integers(2014, 2024, num_rows),
+            **{
+                col: rng.lognormal(5, 2, num_rows).round(1)
+                for col in building_cols_to_analyze
+            },
+        }
+    )
+    # Missing values, a year with a single building, and a column nobody reported in one year
+    building_data = building_data.mask(rng.random(building_data.shape) < 0.2)
+    building_data["DataYear"] = building_data["DataYear"].fillna(2020).astype(int)
+    building_data.loc[0, "DataYear"] = 2024
+    building_data.loc[building_data["DataYear"] == 2021, "DistrictSteamUse"] = None
+
+    expected = {}
+
+    for year in sorted(building_data["DataYear"].unique()):
+        if year < 2016:
+            continue
+
+        year_stats_df = (
+            building_data.loc[
+                building_data["DataYear"] == year, building_cols_to_analyze
+            ]
+            .describe()
+            .loc[["count", "mean", "std", "min", "max", "25%", "50%", "75%"]]
+            .round(1)
+            .rename(
+                index={
+                    "25%": "twentyFifthPercentile",
+                    "50%": "median",
+                    "75%": "seventyFifthPercentile",
+                }
+            )
+        )
+        expected[str(year)] = clean_year_stats(year_stats_df.to_dict())
+
+    yearly_stats = describe_by_year(building_data)
+
+    assert yearly_stats == expected
+    # The JSON is written in the same order too
+    assert list(yearly_stats) == list(expected)
+    for year in expected:
+        assert list(yearly_stats[year]) == list(expected[year])
+        for col in expected[year]:
+            assert list(yearly_stats[year][col]) == list(expected[year][col])
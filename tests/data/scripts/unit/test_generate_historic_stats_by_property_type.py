@@ -1,10 +1,14 @@
+import numpy as np
 import pytest
 import pandas as pd
 from unittest.mock import patch, mock_open
 from src.data.scripts.generate_historic_stats_by_property_type import (
     calculate_historic_stats_by_property_type,
 )
-from src.data.scripts.generate_historic_stats import building_cols_to_analyze
+from src.data.scripts.generate_historic_stats import (
+    building_cols_to_analyze,
+    clean_year_stats,
+)
 
 
 @pytest.fixture
@@ -233,3 +237,66 @@ def test_writes_same_data_to_both_files(sample_building_data):
         debug_data = mock_json_dump.call_args_list[1][0][0]
         assert dist_data == debug_data
         assert mock_json_dump.call_args_list[1][1].get("indent") == 4
+
+
+def test_matches_describing_each_property_type_and_year():
+    """Stats from the single grouped pass match describing each (property type, year) on its own,
+    in the same order."""
+    rng = np.random.default_rng(11)
+    num_rows = 500
+
+    data = pd.DataFrame(
+        {
+            "DataYear": rng.integers(2014, 2024, num_rows),
+            "PrimaryPropertyType": rng.choice(
+                ["Office", "Hotel", "K-12 School", "Multifamily Housing", None],
+                num_rows,
+            ),
+            **{
+                col: rng.lognormal(5, 2, num_rows).round(1)
+                for col in building_cols_to_analyze
+            },
+        }
+    )
+    for col in building_cols_to_analyze:
+        data.loc[rng.random(num_rows) < 0.2, col] = None
+    # A property type that only reported before 2016 is left out entirely
+    data.loc[0, ["PrimaryPropertyType", "DataYear"]] = ["Laboratory", 2015]
+
+    expected = {}
+
+    for property_type in sorted(data["PrimaryPropertyType"].dropna().unique()):
+        prop_data = data[data["PrimaryPropertyType"] == property_type]
+        yearly_stats = {}
+
+        for year in sorted(data["DataYear"].unique()):
+            year_data = prop_data[prop_data["DataYear"] == year]
+
+            if year < 2016 or year_data.empty:
+                continue
+
+            year_stats_df = (
+                year_data[building_cols_to_analyze]
+                .describe()
+                .loc[["count", "mean", "std", "min", "max", "25%", "50%", "75%"]]
+                .round(1)
+                .rename(
+                    index={
+                        "25%": "twentyFifthPercentile",
+                        "50%": "median",
+                        "75%": "seventyFifthPercentile",
+                    }
+                )
+            )
+            yearly_stats[str(year)] = clean_year_stats(year_stats_df.to_dict())
+
+        if yearly_stats:
+            expected[property_type] = yearly_stats
+
+    _, stats = _run_and_capture(data)
+
+    assert stats == expected
+    assert "Laboratory" not in stats
+    assert list(stats) == list(expected)
+    for property_type in expected:
+        assert list(stats[property_type]) == list(expected[property_type])
@@ -239,7 +239,7 @@ def test_rank_only_applies_to_latest_year_buildings(data_center_buildings):
     latest_building_data = building_data[building_data["DataYear"] == latest_year]
     latest_year_grouped = latest_building_data.groupby("PrimaryPropertyType")
 
-    with patch("src.data.scripts.generate_property_type_stats.output_to_csv"):
+    with patch("src.data.scripts.generate_property_type_stats.save_pipeline_frame"):
         rank_buildings_by_property_type(building_data, latest_year_grouped)
 
     latest_rows = building_data[building_data["DataYear"] == 2023]
@@ -258,7 +258,7 @@ def test_rank_assigns_rank_1_to_highest_emitter(data_center_buildings):
     latest_building_data = building_data[building_data["DataYear"] == latest_year]
     latest_year_grouped = latest_building_data.groupby("PrimaryPropertyType")
 
-    with patch("src.data.scripts.generate_property_type_stats.output_to_csv"):
+    with patch("src.data.scripts.generate_property_type_stats.save_pipeline_frame"):
         rank_buildings_by_property_type(building_data, latest_year_grouped)
 
     latest_rows = building_data[building_data["DataYear"] == 2023]
@@ -274,7 +274,7 @@ def test_rank_covers_all_latest_year_buildings(data_center_buildings):
     latest_building_data = building_data[building_data["DataYear"] == latest_year]
     latest_year_grouped = latest_building_data.groupby("PrimaryPropertyType")
 
-    with patch("src.data.scripts.generate_property_type_stats.output_to_csv"):
+    with patch("src.data.scripts.generate_property_type_stats.save_pipeline_frame"):
         rank_buildings_by_property_type(building_data, latest_year_grouped)
 
     latest_rows = building_data[building_data["DataYear"] == 2023]
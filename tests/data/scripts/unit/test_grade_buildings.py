@@ -1,9 +1,15 @@
 import pytest
+import numpy as np
 import pandas as pd
 from pandas.testing import assert_series_equal
+from scipy.stats import percentileofscore
 from unittest.mock import patch
 
 from src.data.scripts.grade_buildings import (
+    apply_grade_func_all_years,
+    calculate_building_submission_rate,
+    calculate_weak_percentiles,
+    generate_energy_int_grade,
     generate_percentile_grade,
     generate_energymix_grade,
     generate_consistent_reporting_grade,
@@ -47,6 +53,39 @@ def test_generate_percentile_grade():
     assert all(0 <= p <= 100 for p in percentiles_rev)
 
 
+@pytest.mark.parametrize("reverse", [False, True])
+def test_generate_percentile_grade_matches_percentileofscore(reverse):
+    """Test the vectorized percentiles exactly match running percentileofscore on each value,
+    including ties, NaN values and scores that aren't round numbers"""
+    rng = np.random.default_rng(42)
+    test_values = pd.Series(
+        np.concatenate(
+            [rng.lognormal(2, 1, 500), rng.integers(0, 20, 200), [np.nan] * 50]
+        ),
+        index=rng.permutation(750) + 1000,
+    )
+
+    result = generate_percentile_grade(test_values, "TestCol", reverse=reverse)
+
+    def calc_func(x):
+        percentile = percentileofscore(test_values, x, kind="weak", nan_policy="omit")
+        return 100 - percentile if reverse else percentile
+
+    expected = test_values.apply(calc_func)
+
+    assert_series_equal(
+        result["TestColPercentileGrade"], expected, check_names=False, rtol=0, atol=0
+    )
+    assert result["TestColLetterGrade"].isna().sum() == 50
+
+
+def test_calculate_weak_percentiles_edge_cases():
+    """Test a single value is the 100th percentile, and no values to compare gives NaN"""
+    assert calculate_weak_percentiles(pd.Series([5.0])).tolist() == [100.0]
+    assert calculate_weak_percentiles(pd.Series([np.nan, np.nan])).isna().all()
+    assert calculate_weak_percentiles(pd.Series([], dtype=float)).empty
+
+
 # Test grade_ghg_intensity_energy_mix_all_years function
 def test_grade_ghg_intensity_energy_mix_all_years():
     # Create test data with multiple years
@@ -196,6 +235,50 @@ def test_generate_consistent_reporting_grade():
     assert id5_row["MissingRecordsCount"].values[0] == 3
 
 
+def test_calculate_building_submission_rate():
+    """Test submission rates count only years with real GHG Intensity data"""
+    test_data = pd.DataFrame(
+        {
+            "ID": ["2", "2", "2", "1", "1", "1", "3", "3"],
+            "DataYear": [2020, 2021, 2022, 2020, 2021, 2022, 2021, 2022],
+            "GHGIntensity": [10.5, None, 0, 3.2, 4.1, 5.0, None, None],
+        }
+    )
+
+    result = calculate_building_submission_rate(test_data)
+
+    expected = pd.DataFrame(
+        {
+            "ID": ["1", "2", "3"],
+            "submission_rate": [100.0, 100 / 3, 0.0],
+            "not_submitted_count": [0.0, 2.0, 2.0],
+        }
+    )
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_calculate_building_submission_rate_counts_duplicate_years():
+    """Test a building with two records for a year counts each record, reported or not"""
+    test_data = pd.DataFrame(
+        {
+            "ID": ["1", "1", "1", "2"],
+            "DataYear": [2020, 2020, 2021, 2020],
+            "GHGIntensity": [1.0, None, 2.0, None],
+        }
+    )
+
+    result = calculate_building_submission_rate(test_data)
+
+    expected = pd.DataFrame(
+        {
+            "ID": ["1", "2"],
+            "submission_rate": [200 / 3, 0.0],
+            "not_submitted_count": [1.0, 1.0],
+        }
+    )
+    pd.testing.assert_frame_equal(result, expected)
+
+
 # Test calculate_weighted_average function
 def test_calculate_weighted_average():
     # Create test data with different grade combinations
@@ -218,6 +301,43 @@ def test_calculate_weighted_average():
     assert_series_equal(result, expected)
 
 
+def test_grade_all_years_matches_grading_each_year():
+    """Test grading every year in one pass gives the same grades as grading each year separately
+    and merging the results together"""
+    rng = np.random.default_rng(7)
+    num_records = 600
+    test_data = pd.DataFrame(
+        {
+            "ID": np.arange(num_records) % 150,
+            "DataYear": 2016 + np.arange(num_records) // 150,
+            "GHGIntensity": rng.lognormal(1, 1, num_records).round(1),
+            "ElectricityUse": rng.integers(0, 1000, num_records).astype(float),
+            "NaturalGasUse": rng.integers(0, 1000, num_records).astype(float),
+            "DistrictSteamUse": rng.choice([0.0, 500.0], num_records),
+            "DistrictChilledWaterUse": rng.choice([0.0, 200.0], num_records),
+            "AllOtherFuelUse": 0.0,
+        }
+    )
+
+    # Some records with no data at all, like buildings that didn't submit that year
+    no_data = rng.choice(num_records, 40, replace=False)
+    test_data.loc[no_data, test_data.columns[2:]] = np.nan
+
+    expected = pd.merge(
+        test_data,
+        pd.merge(
+            apply_grade_func_all_years(test_data, generate_energy_int_grade),
+            apply_grade_func_all_years(test_data, generate_energymix_grade),
+            on=["ID", "DataYear"],
+        ),
+        on=["ID", "DataYear"],
+    )
+
+    result = grade_ghg_intensity_energy_mix_all_years(test_data)
+
+    pd.testing.assert_frame_equal(result, expected, check_exact=True)
+
+
 # Test for energy mix grading logic
 def test_energy_mix_grading():
     # This test validates the energy mix grading logic more directly
@@ -0,0 +1,180 @@
+import os
+import pandas as pd
+import pytest
+from unittest.mock import patch
+
+from src.data.scripts import pipeline_context
+from src.data.scripts.pipeline_context import (
+    PipelineContext,
+    NEWEST_DATA,
+    BUILDING_BENCHMARKS,
+    HISTORIC_DATA,
+    compact_frame,
+    load_pipeline_frame,
+    save_pipeline_frame,
+)
+
+
+@pytest.fixture(autouse=True)
+def pipeline_frames_directory(tmp_path):
+    """Keep the typed copies of frames out of the real debug directory"""
+    frames_directory = str(tmp_path / "pipeline-frames")
+
+    with patch.object(pipeline_context, "pipeline_frames_directory", frames_directory):
+        yield frames_directory
+
+
+def test_get_loads_frame_once():
+    """Test that a frame not set by a step is loaded, and only on first use"""
+    mock_data = pd.DataFrame({"ID": ["1", "2"]})
+    context = PipelineContext()
+
+    with patch(
+        "src.data.scripts.pipeline_context.get_and_clean_csv", return_value=mock_data
+    ) as mock_read:
+        assert context.get(NEWEST_DATA) is mock_data
+        assert context.get(NEWEST_DATA) is mock_data
+
+        mock_read.assert_called_once()
+
+    # Loading a frame doesn't mean it needs writing back out
+    assert context.changed == []
+
+
+def test_set_frame_is_returned_without_reading():
+    """Test that a frame set by an earlier step is handed to later steps as is"""
+    building_data = pd.DataFrame({"ID": ["1"], "GHGIntensity": [1.5]})
+    context = PipelineContext()
+
+    with patch("src.data.scripts.pipeline_context.get_and_clean_csv") as mock_read:
+        context.set(BUILDING_BENCHMARKS, building_data)
+
+        assert context.get(BUILDING_BENCHMARKS) is building_data
+        mock_read.assert_not_called()
+
+
+def test_write_outputs_writes_each_changed_frame_once():
+    """Test that only the frames that were set are written, in the order they were set"""
+    context = PipelineContext()
+    context.set(HISTORIC_DATA, pd.DataFrame({"ID": ["1"]}))
+    context.set(BUILDING_BENCHMARKS, pd.DataFrame({"ID": ["1"]}))
+    context.set(HISTORIC_DATA, pd.DataFrame({"ID": ["2"]}))
+
+    with patch("src.data.scripts.pipeline_context.output_to_csv") as mock_output:
+        paths = context.write_outputs()
+
+    assert [path.split("/")[-1] for path in paths] == [
+        "benchmarking-all-years.csv",
+        "building-benchmarks.csv",
+    ]
+    assert mock_output.call_count == 2
+
+    # The latest frame set is the one written
+    assert mock_output.call_args_list[0].args[0]["ID"].tolist() == ["2"]
+
+    # Nothing is left to write after writing
+    assert context.write_outputs() == []
+
+
+def test_saved_frame_loads_with_its_dtypes(tmp_path):
+    """Test that a saved frame loads from its typed copy, keeping nullable ints and strings"""
+    csv_path = str(tmp_path / "building-benchmarks.csv")
+    building_data = pd.DataFrame(
+        {
+            "ID": [1, 2],
+            "ZIPCode": pd.array(["60614", None], dtype="string"),
+            "ENERGYSTARScore": pd.array([50, None], dtype="Int64"),
+        }
+    )
+
+    with patch.object(
+        pipeline_context, "get_pipeline_file_path", return_value=csv_path
+    ):
+        assert save_pipeline_frame(BUILDING_BENCHMARKS, building_data) == csv_path
+
+        with patch.object(pipeline_context, "get_and_clean_csv") as mock_read:
+            loaded = load_pipeline_frame(BUILDING_BENCHMARKS)
+
+            mock_read.assert_not_called()
+
+    assert os.path.exists(csv_path)
+    pd.testing.assert_frame_equal(loaded, building_data)
+
+
+def test_changed_csv_is_loaded_over_typed_copy(tmp_path):
+    """Test that if the CSV changes after the typed copy is saved, we load the CSV, even if it's
+    older (e.g. copied in with its modified time kept)"""
+    csv_path = str(tmp_path / "building-benchmarks.csv")
+
+    with patch.object(
+        pipeline_context, "get_pipeline_file_path", return_value=csv_path
+    ):
+        save_pipeline_frame(BUILDING_BENCHMARKS, pd.DataFrame({"ID": [1]}))
+
+        pd.DataFrame({"ID": [2]}).to_csv(csv_path, index=False)
+        os.utime(csv_path, ns=(0, 0))
+
+        assert load_pipeline_frame(BUILDING_BENCHMARKS)["ID"].tolist() == [2]
+
+
+def test_typed_copy_is_loaded_for_unchanged_csv(tmp_path):
+    """Test that the typed copy is still used if its CSV is rewritten with the same contents"""
+    csv_path = str(tmp_path / "building-benchmarks.csv")
+
+    with patch.object(
+        pipeline_context, "get_pipeline_file_path", return_value=csv_path
+    ):
+        save_pipeline_frame(BUILDING_BENCHMARKS, pd.DataFrame({"ID": [1]}))
+
+        with open(csv_path, "rb") as f:
+            csv_contents = f.read()
+        with open(csv_path, "wb") as f:
+            f.write(csv_contents)
+
+        with patch.object(pipeline_context, "get_and_clean_csv") as mock_read:
+            assert load_pipeline_frame(BUILDING_BENCHMARKS)["ID"].tolist() == [1]
+
+            mock_read.assert_not_called()
+
+
+def test_compact_frame_shrinks_historic_data():
+    """Test that the historic data is stored with its compact types, using less memory"""
+    historic_data = pd.DataFrame(
+        {
+            "ID": [101, 102, 101, 102] * 50,
+            "DataYear": [2022, 2022, 2023, 2023] * 50,
+            "ReportingStatus": ["Submitted Data", "Not Submitted"] * 100,
+            "ChicagoEnergyRating": [4.0, None, 2.5, 0.0] * 50,
+            "GHGIntensity": [1.5, None, 2.0, 3.25] * 50,
+        }
+    )
+
+    compacted = compact_frame(HISTORIC_DATA, historic_data)
+
+    assert compacted["ID"].dtype == "int32"
+    assert compacted["DataYear"].dtype == "int16"
+    assert isinstance(compacted["ReportingStatus"].dtype, pd.CategoricalDtype)
+    assert isinstance(compacted["ChicagoEnergyRating"].dtype, pd.CategoricalDtype)
+    # Measurements are left as is, so no precision is lost
+    assert compacted["GHGIntensity"].dtype == "float64"
+
+    assert compacted.memory_usage(deep=True).sum() < (
+        historic_data.memory_usage(deep=True).sum()
+    )
+    pd.testing.assert_frame_equal(
+        compacted, historic_data, check_dtype=False, check_categorical=False
+    )
+
+
+def test_historic_data_csv_loads_compacted(tmp_path):
+    """Test that the historic data loaded from its CSV gets the same compact types"""
+    csv_path = str(tmp_path / "benchmarking-all-years.csv")
+    pd.DataFrame({"ID": [1], "DataYear": [2023]}).to_csv(csv_path, index=False)
+
+    with patch.object(
+        pipeline_context, "get_pipeline_file_path", return_value=csv_path
+    ):
+        loaded = load_pipeline_frame(HISTORIC_DATA)
+
+    assert loaded["ID"].dtype == "int32"
+    assert loaded["DataYear"].dtype == "int16"
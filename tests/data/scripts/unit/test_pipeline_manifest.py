@@ -0,0 +1,177 @@
+import os
+import pandas as pd
+import pytest
+from unittest.mock import patch
+
+from src.data.scripts import pipeline_manifest
+from src.data.scripts.pipeline_context import (
+    PipelineContext,
+    BUILDING_BENCHMARKS,
+    HISTORIC_DATA,
+)
+from src.data.scripts.pipeline_manifest import (
+    can_skip_step,
+    cache_step_outputs,
+    get_code_files,
+    get_step_keys,
+    restore_step_outputs,
+)
+
+
+@pytest.fixture
+def pipeline_steps(tmp_path):
+    """Three steps, where the second reads what the first outputs and the third is independent"""
+    owners_path = tmp_path / "owners.json"
+    owners_path.write_text('{"owner": ["1"]}')
+
+    fines_path = tmp_path / "fines-by-year.json"
+
+    return [
+        {
+            "module": "src.data.scripts.process_data",
+            "inputs": [],
+            "outputs": [BUILDING_BENCHMARKS],
+            "input_files": [],
+            "output_files": [],
+        },
+        {
+            "module": "src.data.scripts.add_building_owners",
+            "inputs": [BUILDING_BENCHMARKS],
+            "outputs": [BUILDING_BENCHMARKS],
+            "input_files": [str(owners_path)],
+            "output_files": [],
+        },
+        {
+            "module": "src.data.scripts.calculate_fines",
+            "inputs": [HISTORIC_DATA],
+            "outputs": [],
+            "input_files": [],
+            "output_files": [str(fines_path)],
+        },
+    ]
+
+
+def test_get_code_files_follows_imports():
+    """Test that a step's code includes the modules it imports, directly or not"""
+    code_files = get_code_files("src.data.scripts.process_data")
+
+    assert os.path.join("src", "data", "scripts", "process_data.py") in code_files
+    assert os.path.join("src", "data", "scripts", "grade_buildings.py") in code_files
+
+    # Imported by grade_buildings, not process_data directly
+    assert (
+        os.path.join("src", "data", "scripts", "generate_historic_stats.py")
+        in code_files
+    )
+
+
+def test_step_keys_only_change_downstream(pipeline_steps):
+    """Test that changing a step's input file changes its key and not those of unrelated steps"""
+    keys_before = get_step_keys(pipeline_steps)
+
+    with open(pipeline_steps[1]["input_files"][0], "w") as f:
+        f.write('{"owner": ["1", "2"]}')
+
+    keys_after = get_step_keys(pipeline_steps)
+
+    assert keys_before[0] == keys_after[0]
+    assert keys_before[1] != keys_after[1]
+    assert keys_before[2] == keys_after[2]
+
+
+def test_step_keys_include_upstream_steps(pipeline_steps):
+    """Test that a step's key changes when the step outputting its input frame changes"""
+    keys_before = get_step_keys(pipeline_steps)
+
+    with patch.object(
+        pipeline_manifest,
+        "hash_file",
+        side_effect=lambda path: "changed" if "process_data" in path else "same",
+    ):
+        keys_changed = get_step_keys(pipeline_steps)
+
+    assert keys_before[0] != keys_changed[0]
+    assert keys_before[1] != keys_changed[1]
+
+
+def test_cache_and_restore_step_outputs(pipeline_steps, tmp_path):
+    """Test that a cached step can be skipped, and restoring it puts its outputs back in place"""
+    step = pipeline_steps[2]
+    fines_path = step["output_files"][0]
+
+    with patch.object(pipeline_manifest, "cache_directory", str(tmp_path / "cache")):
+        with open(fines_path, "w") as f:
+            f.write('{"total": 1}')
+
+        # Never run, so can't be skipped
+        assert not can_skip_step(step, "key", {})
+
+        cache_step_outputs(step)
+        os.remove(fines_path)
+
+        assert can_skip_step(step, "key", {step["module"]: "key"})
+        assert not can_skip_step(step, "other key", {step["module"]: "key"})
+
+        restore_step_outputs(step)
+
+    with open(fines_path) as f:
+        assert f.read() == '{"total": 1}'
+
+
+def test_restore_sets_frames_in_context(pipeline_steps, tmp_path):
+    """Test that restoring a step's frames in-process sets them in the context to be written out"""
+    step = pipeline_steps[0]
+    context = PipelineContext()
+    context.set(BUILDING_BENCHMARKS, pd.DataFrame({"ID": ["1"]}))
+
+    with (
+        patch.object(pipeline_manifest, "cache_directory", str(tmp_path / "cache")),
+        patch.object(
+            pipeline_manifest,
+            "get_pipeline_frame_path",
+            return_value=str(tmp_path / "building_benchmarks.pkl"),
+        ),
+    ):
+        cache_step_outputs(step, context)
+
+        # Only the typed copy is cached, not the CSV
+        assert os.listdir(tmp_path / "cache" / "process_data") == [
+            "building_benchmarks.pkl"
+        ]
+
+        restored_context = PipelineContext()
+        restore_step_outputs(step, restored_context)
+
+    assert restored_context.changed == [BUILDING_BENCHMARKS]
+    assert restored_context.frames[BUILDING_BENCHMARKS]["ID"].tolist() == ["1"]
+
+
+def test_restore_writes_frames_without_context(pipeline_steps, tmp_path):
+    """Test that restoring a step's frames for subprocess steps rebuilds their CSVs"""
+    step = pipeline_steps[0]
+    csv_path = str(tmp_path / "building-benchmarks.csv")
+    frame_path = str(tmp_path / "building_benchmarks.pkl")
+
+    pd.DataFrame({"ID": ["1"]}).to_pickle(frame_path)
+
+    with (
+        patch.object(pipeline_manifest, "cache_directory", str(tmp_path / "cache")),
+        patch.object(
+            pipeline_manifest, "get_pipeline_frame_path", return_value=frame_path
+        ),
+        patch(
+            "src.data.scripts.pipeline_context.get_pipeline_file_path",
+            return_value=csv_path,
+        ),
+        patch(
+            "src.data.scripts.pipeline_context.pipeline_frames_directory",
+            str(tmp_path),
+        ),
+    ):
+        cache_step_outputs(step)
+        os.remove(frame_path)
+
+        restore_step_outputs(step)
+
+    assert pd.read_csv(csv_path, dtype=str)["ID"].tolist() == ["1"]
+    assert pd.read_pickle(frame_path)["ID"].tolist() == ["1"]
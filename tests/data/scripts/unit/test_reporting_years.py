@@ -1,7 +1,13 @@
 """Tests for FirstYearReported and LastYearReported calculation logic"""
 
+import numpy as np
 import pandas as pd
-from src.data.scripts.generate_historic_stats import calculateFirstAndLastYearReported
+import pytest
+from src.data.scripts.generate_historic_stats import (
+    calculateFirstAndLastYearReported,
+    hasReportedData,
+    hasReportedDataMask,
+)
 
 
 def test_single_year_reporting():
@@ -16,8 +22,8 @@ def test_single_year_reporting():
 
     result = calculateFirstAndLastYearReported(df)
 
-    assert result["12345"]["FirstYearReported"] == 2023
-    assert result["12345"]["LastYearReported"] == 2023
+    assert result.loc["12345", "FirstYearReported"] == 2023
+    assert result.loc["12345", "LastYearReported"] == 2023
 
 
 def test_multiple_years_continuous():
@@ -32,8 +38,8 @@ def test_multiple_years_continuous():
 
     result = calculateFirstAndLastYearReported(df)
 
-    assert result["12345"]["FirstYearReported"] == 2020
-    assert result["12345"]["LastYearReported"] == 2023
+    assert result.loc["12345", "FirstYearReported"] == 2020
+    assert result.loc["12345", "LastYearReported"] == 2023
 
 
 def test_multiple_years_with_gaps():
@@ -48,8 +54,8 @@ def test_multiple_years_with_gaps():
 
     result = calculateFirstAndLastYearReported(df)
 
-    assert result["12345"]["FirstYearReported"] == 2018
-    assert result["12345"]["LastYearReported"] == 2023
+    assert result.loc["12345", "FirstYearReported"] == 2018
+    assert result.loc["12345", "LastYearReported"] == 2023
 
 
 def test_building_with_zero_ghg():
@@ -65,8 +71,8 @@ def test_building_with_zero_ghg():
     result = calculateFirstAndLastYearReported(df)
 
     # Should start from 2021, not 2020 (since 2020 had zero GHG)
-    assert result["12345"]["FirstYearReported"] == 2021
-    assert result["12345"]["LastYearReported"] == 2022
+    assert result.loc["12345", "FirstYearReported"] == 2021
+    assert result.loc["12345", "LastYearReported"] == 2022
 
 
 def test_building_with_null_ghg():
@@ -82,8 +88,8 @@ def test_building_with_null_ghg():
     result = calculateFirstAndLastYearReported(df)
 
     # Should start from 2021, not 2020 (since 2020 had null GHG)
-    assert result["12345"]["FirstYearReported"] == 2021
-    assert result["12345"]["LastYearReported"] == 2022
+    assert result.loc["12345", "FirstYearReported"] == 2021
+    assert result.loc["12345", "LastYearReported"] == 2022
 
 
 def test_building_with_all_invalid_data():
@@ -99,7 +105,7 @@ def test_building_with_all_invalid_data():
     result = calculateFirstAndLastYearReported(df)
 
     # Building should not be in results at all
-    assert "12345" not in result
+    assert "12345" not in result.index
 
 
 def test_never_submitted_building():
@@ -116,7 +122,7 @@ def test_never_submitted_building():
 
     result = calculateFirstAndLastYearReported(df)
 
-    assert result.get("12345") is None
+    assert "12345" not in result.index
 
 
 def test_multiple_buildings():
@@ -132,16 +138,16 @@ def test_multiple_buildings():
     result = calculateFirstAndLastYearReported(df)
 
     # Building 111: reported 2020 and 2023
-    assert result["111"]["FirstYearReported"] == 2020
-    assert result["111"]["LastYearReported"] == 2023
+    assert result.loc["111", "FirstYearReported"] == 2020
+    assert result.loc["111", "LastYearReported"] == 2023
 
     # Building 222: reported 2019-2021 continuously
-    assert result["222"]["FirstYearReported"] == 2019
-    assert result["222"]["LastYearReported"] == 2021
+    assert result.loc["222", "FirstYearReported"] == 2019
+    assert result.loc["222", "LastYearReported"] == 2021
 
     # Building 333: only reported in 2023
-    assert result["333"]["FirstYearReported"] == 2023
-    assert result["333"]["LastYearReported"] == 2023
+    assert result.loc["333", "FirstYearReported"] == 2023
+    assert result.loc["333", "LastYearReported"] == 2023
 
 
 def test_new_building_in_latest_year():
@@ -156,8 +162,8 @@ def test_new_building_in_latest_year():
 
     result = calculateFirstAndLastYearReported(df)
 
-    assert result["99999"]["FirstYearReported"] == 2023
-    assert result["99999"]["LastYearReported"] == 2023
+    assert result.loc["99999", "FirstYearReported"] == 2023
+    assert result.loc["99999", "LastYearReported"] == 2023
 
 
 def test_stopped_reporting_building():
@@ -172,5 +178,56 @@ def test_stopped_reporting_building():
 
     result = calculateFirstAndLastYearReported(df)
 
-    assert result["88888"]["FirstYearReported"] == 2020
-    assert result["88888"]["LastYearReported"] == 2022
+    assert result.loc["88888", "FirstYearReported"] == 2020
+    assert result.loc["88888", "LastYearReported"] == 2022
+
+
+@pytest.mark.parametrize(
+    "ghg_intensity",
+    [
+        pd.Series([10.5, 0.0, -1.0, np.nan, 0.1]),
+        pd.Series([10, 0, -3, 2]),
+        pd.Series([1.5, None, 0], dtype="Float64"),
+        pd.Series([10.5, "12", None, 0, "n/a", 3], dtype=object),
+    ],
+)
+def test_has_reported_data_mask_matches_has_reported_data(ghg_intensity):
+    """The vectorized check should agree with checking each value, including strings never
+    counting as reported data"""
+    expected = [hasReportedData(value) for value in ghg_intensity.astype(object)]
+
+    assert hasReportedDataMask(ghg_intensity).tolist() == expected
+
+
+def test_reporting_years_indexed_by_string_id():
+    """Results are a DataFrame indexed by ID as a string, even when IDs are read in as numbers,
+    so they line up with building IDs however they were parsed"""
+    df = pd.DataFrame(
+        {
+            "ID": [111, 111, 222],
+            "DataYear": [2021, 2022, 2022],
+            "GHGIntensity": [10.5, 11.2, 8.5],
+        }
+    )
+
+    result = calculateFirstAndLastYearReported(df)
+
+    assert list(result.columns) == ["FirstYearReported", "LastYearReported"]
+    assert result.index.tolist() == ["111", "222"]
+    assert result.loc["111"].tolist() == [2021, 2022]
+
+
+def test_duplicate_year_with_invalid_row():
+    """A year with a valid and an invalid record still counts as reported, whichever comes last"""
+    df = pd.DataFrame(
+        {
+            "ID": ["12345", "12345", "12345", "12345"],
+            "DataYear": [2023, 2020, 2020, 2023],
+            "GHGIntensity": [10.5, 11.2, None, 0],
+        }
+    )
+
+    result = calculateFirstAndLastYearReported(df)
+
+    assert result.loc["12345", "FirstYearReported"] == 2020
+    assert result.loc["12345", "LastYearReported"] == 2023
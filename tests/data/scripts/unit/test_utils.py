@@ -7,10 +7,72 @@ from src.data.scripts.utils import (
     apply_verified_coordinates,
     extract_lon_lat,
     fetch_geojson_coordinates,
+    get_and_clean_csv,
+    iter_csv_chunks,
+    iter_json_records,
+    json_data_builder,
     parse_geojson_field,
+    write_json_records,
 )
 
 
+# --- get_and_clean_csv ---
+
+
+def test_get_and_clean_csv_parses_declared_types(tmp_path):
+    """columns in the schema are read as their declared types, including numbers with commas"""
+    csv_file = tmp_path / "benchmarks.csv"
+    csv_file.write_text(
+        "ID,ZIP Code,GHGIntensity,Latitude,Other\n"
+        '1,60614,"1,234.5",41.8800000,a\n'
+        "2,60614-1234,,41.9,b\n"
+    )
+
+    df = get_and_clean_csv(str(csv_file))
+
+    assert df["ID"].dtype == "int64"
+    assert df["ZIP Code"].tolist() == ["60614", "60614-1234"]
+    assert df["GHGIntensity"].dtype == "float64"
+    assert df["GHGIntensity"].iloc[0] == 1234.5
+    assert df["Latitude"].tolist() == ["41.8800000", "41.9"]
+
+
+def test_get_and_clean_csv_only_reads_cols_to_keep(tmp_path):
+    """only the columns to keep are returned, in the order asked for"""
+    csv_file = tmp_path / "benchmarks.csv"
+    csv_file.write_text("ID,DataYear,GHGIntensity\n1,2020,1.5\n")
+
+    df = get_and_clean_csv(str(csv_file), ["GHGIntensity", "ID"])
+
+    assert df.columns.tolist() == ["GHGIntensity", "ID"]
+
+
+def test_get_and_clean_csv_drops_rows_missing_keys(tmp_path):
+    """rows with a blank ID or data year are dropped instead of failing the whole read"""
+    csv_file = tmp_path / "benchmarks.csv"
+    csv_file.write_text(
+        "Data Year,ID,GHGIntensity\n2020,1,1.5\n2020,,2.5\n,3,3.5\n2021,4,\n"
+    )
+
+    df = get_and_clean_csv(str(csv_file))
+
+    assert df["ID"].tolist() == [1, 4]
+    assert df["Data Year"].tolist() == [2020, 2021]
+    assert df["ID"].dtype == "int64"
+    assert df["Data Year"].dtype == "int64"
+
+
+def test_iter_csv_chunks_drops_rows_missing_keys(tmp_path):
+    """chunked reads drop rows with a blank ID or data year the same way"""
+    csv_file = tmp_path / "benchmarks.csv"
+    csv_file.write_text("DataYear,ID\n2020,1\n2020,\n2021,3\n")
+
+    chunks = list(iter_csv_chunks(str(csv_file), 2))
+
+    assert [chunk["ID"].tolist() for chunk in chunks] == [[1], [3]]
+    assert all(chunk["DataYear"].dtype == "int64" for chunk in chunks)
+
+
 # --- fetch_geojson_coordinates ---
 
 
@@ -296,3 +358,90 @@ def test_apply_verified_coordinates_multiple_buildings():
     assert result.loc[0, "Latitude"] == pytest.approx(41.95)
     assert result.loc[1, "Longitude"] == pytest.approx(-87.63)
     assert result.loc[1, "Latitude"] == pytest.approx(41.88)
+
+
+def test_apply_verified_coordinates_mixed_sources_and_string_ids():
+    """State Plane points are all transformed together, the last feature for a building wins, and
+    string IDs (as read from the CSV) still match"""
+    transformer = Transformer.from_crs("EPSG:3435", "EPSG:4326", always_xy=True)
+    df = make_building_df(
+        [
+            {"ID": str(i), "Latitude": "0", "Longitude": "0", "Location": "(0, 0)"}
+            for i in range(1, 5)
+        ]
+    )
+    geojson = make_geojson(
+        [
+            {
+                "type": "Feature",
+                "properties": {"building_id": 1, "geojson": None},
+                "geometry": {"type": "Point", "coordinates": [1176000, 1901000]},
+            },
+            {
+                "type": "Feature",
+                "properties": {"building_id": "2", "geojson": None},
+                "geometry": {"type": "Point", "coordinates": [1160000, 1890000]},
+            },
+            {
+                "type": "Feature",
+                "properties": {
+                    "building_id": 3,
+                    "geojson": '{"type": "Point", "coordinates": [-87.70, 41.95]}',
+                },
+                "geometry": None,
+            },
+            {
+                "type": "Feature",
+                "properties": {
+                    "building_id": 1,
+                    "geojson": '{"type": "Point", "coordinates": [-87.61, 41.89]}',
+                },
+                "geometry": None,
+            },
+        ]
+    )
+
+    result = apply_verified_coordinates(df, geojson)
+
+    lon_2, lat_2 = transformer.transform(1160000, 1890000)
+    assert result["Latitude"].tolist() == [41.89, lat_2, 41.95, "0"]
+    assert result["Longitude"].tolist() == [-87.61, lon_2, -87.70, "0"]
+    assert result.loc[1, "Location"] == f"({lat_2}, {lon_2})"
+    assert result.loc[3, "Location"] == "(0, 0)"
+
+
+# --- json_data_builder / write_json_records ---
+
+
+def test_json_data_builder_one_record_per_building():
+    """Each building gets one record from its first row, with missing values as empty strings"""
+    df = pd.DataFrame(
+        {
+            "ID": ["2", "1", "2"],
+            "PropertyName": ["Two", None, "Two (again)"],
+            "GHGIntensity": [1.5, float("nan"), 3.0],
+            "DataYear": [2023, 2023, 2022],
+        }
+    )
+
+    records = json_data_builder(df)
+
+    assert records == [
+        {"ID": "2", "PropertyName": "Two", "GHGIntensity": 1.5, "DataYear": 2023},
+        {"ID": "1", "PropertyName": "", "GHGIntensity": "", "DataYear": 2023},
+    ]
+    assert list(iter_json_records(df, chunk_size=1)) == records
+
+
+@pytest.mark.parametrize("num_records", [0, 1, 3])
+def test_write_json_records_matches_json_dump(tmp_path, num_records):
+    """Streaming records out should give the same file as dumping the whole list at once"""
+    records = [
+        {"ID": str(i), "Name": f'Building "{i}"\n', "Owner": {"Name": "é"}}
+        for i in range(num_records)
+    ]
+    path = tmp_path / "records.json"
+
+    write_json_records(iter(records), str(path))
+
+    assert path.read_text() == json.dumps(records, ensure_ascii=True, indent=4) + "\n"